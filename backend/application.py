@@ -1,32 +1,62 @@
 from fastapi import FastAPI, HTTPException, BackgroundTasks, WebSocket
 from fastapi.responses import JSONResponse
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 import sys,uvicorn, aiofiles,os
 from src.utils.exception import customException
 from src.utils.logger import logging
 from starlette.responses import JSONResponse
-from src.database.supabase_config import Supabase
-from src.database.firebase_config import Firebase
-from pydantic import BaseModel, ConfigDict,  ValidationError
+from src.database.async_supabase import AsyncSupabase, supabase_executor
+from pydantic import BaseModel, ConfigDict,  ValidationError, Field
 from typing import Optional
 from starlette.websockets import WebSocketDisconnect, WebSocketState
 from enum import Enum
-import json, requests
-from src.geofences import is_within_geofence, has_alert_been_sent, mark_alert_as_sent, get_lat_long_opencage
-from src.sos_workflow import notify_contacts
+import json
+from src.geofences import track_location, match_pings, replay_pings, get_lat_long_opencage, geofence_cache, geofence_state, movement_filter, opencage
+from src.sos_workflow import sos_outbox, warm_contacts
+from src.contact_store import contact_store
+from src.sos_coalescer import sos_coalescer
 from src.safe_route import OpenRouteService
 from typing import List
-from src.services.pinata_config import Pinata
-from src.pipelines.audio_processing import Audio_Processing
+from src.services.ipfs_cache import ipfs_cache
+from src.pipelines.stream_classifier import AudioStream
+from src.pipelines.streaming_features import StreamingMFCC
+from src.pipelines.vad import energy_gate
+from src.pipelines.inference_scheduler import InferenceBusy
+from src.pipelines.feature_executor import feature_executor
+from src.services.http_client import http_client
+from src.incident_retrieval import stream_incidents
+from src.clients import clients, supabase, firebase, pinata, audio
+from src.warmup import warmup
 import asyncio
 
 app = FastAPI()
-firebase=Firebase()
-supabase=Supabase()
+# Database calls from async endpoints go through the bounded Supabase executor
+db=AsyncSupabase(supabase)
 ors=OpenRouteService()
-pinata=Pinata()
-audio=Audio_Processing()
+warmup_task=None
+
+async def warm_geofences():
+    # The first geofence load also builds the Supabase client and opens its connection
+    await asyncio.to_thread(geofence_cache.start)
+    if geofence_cache.version == 0:
+        raise RuntimeError("Geofence table could not be loaded")
+
+# Heavy clients and the audio model are built here, after startup, instead of at import time
+warmup.add("geofences", warm_geofences)
+warmup.add("firebase", lambda: asyncio.to_thread(clients.get, "firebase"))
+warmup.add("twilio", lambda: asyncio.to_thread(clients.get, "twilio"))
+warmup.add("audio_model", lambda: audio.warm_up())
+if ors.road_graph_path:
+    # The offline road graph is loaded and indexed once, before the first /safe-route request needs it
+    warmup.add("road_graph", lambda: asyncio.to_thread(ors.get_local_router))
+warmup.add("http", lambda: http_client.prime([
+    "https://gateway.pinata.cloud",
+    "https://api.pinata.cloud",
+    "https://graph.facebook.com",
+    "https://api.opencagedata.com",
+    "https://api.openrouteservice.org",
+]), required=False)
 
 # Configure CORS
 app.add_middleware(
@@ -37,6 +67,29 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def startup():
+    global warmup_task
+    geofence_state.start()
+    # Deliver SOS notifications queued in the outbox, including any left over from a previous run
+    await sos_outbox.start()
+    # Warm-up runs in the background; /ready reports when it is done
+    skip=[name.strip() for name in os.getenv("WARMUP_SKIP", "").split(",") if name.strip()]
+    warmup_task=asyncio.create_task(warmup.run(skip=skip))
+
+@app.on_event("shutdown")
+async def shutdown():
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    await sos_outbox.stop()
+    if "audio" in clients.loaded():
+        await audio.shutdown()
+    geofence_cache.stop()
+    geofence_state.stop()
+    await http_client.aclose()
+    supabase_executor.shutdown()
+    feature_executor.shutdown()
+
 # Define the possible incident types
 class IncidentType(str, Enum):
     harassment = "Harassment"
@@ -68,6 +121,14 @@ class UserLocation(BaseModel):
     latitude: float
     longitude: float
 
+# Buffered location ping, timestamp in epoch seconds
+class LocationPing(UserLocation):
+    timestamp: Optional[float] = None
+
+class LocationBatch(BaseModel):
+    # Bounded so one request cannot hold a worker thread for long
+    pings: List[LocationPing] = Field(max_length=int(os.getenv("LOCATION_BATCH_MAX_PINGS", "1000")))
+
 #Geofence Model
 class Geofence(BaseModel):
     location: str
@@ -78,17 +139,28 @@ class FamilyMember(BaseModel):
     relation: str
     phone_number: str
 
-async def trigger_sos_logic(user_id: str, latitude: float, longitude: float, username: str, background_tasks: BackgroundTasks):
+async def trigger_sos_logic(user_id: str, latitude: float, longitude: float, username: str):
     """
-    Triggers an SOS event logic (insert alert data and send notifications).
+    Triggers an SOS event logic (insert alert data and queue notifications).
+    Repeated triggers within the user's coalescing window update the open alert instead.
     """
-    alert_data = {
-        "user_id": user_id,
-        "latitude": latitude,
-        "longitude": longitude,
-    }
-    sos_alert_id = (supabase.insert_sos_alerts(alert_data)).data
-    sos_alert_id = sos_alert_id[0]["id"]
+    async with sos_coalescer.hold(user_id):
+        sos_alert_id = await sos_coalescer.active_alert(user_id)
+        if sos_alert_id is not None:
+            await db.update_sos_alert_location(sos_alert_id, latitude, longitude)
+            return sos_alert_id
+
+        alert_data = {
+            "user_id": user_id,
+            "latitude": latitude,
+            "longitude": longitude,
+        }
+        response = await db.insert_sos_alerts(alert_data)
+        if not response or not response.data:
+            sos_coalescer.release(user_id)
+            raise HTTPException(status_code=500, detail="Failed to create SOS alert")
+        sos_alert_id = response.data[0]["id"]
+        sos_coalescer.open(user_id, sos_alert_id)
     
     user = {
         "user_id": user_id,
@@ -97,7 +169,8 @@ async def trigger_sos_logic(user_id: str, latitude: float, longitude: float, use
         "longitude": longitude
     }
     
-    await notify_contacts(user)
+    # Notifications are sent by the outbox workers
+    sos_outbox.enqueue(sos_alert_id, user)
     
     return sos_alert_id
 
@@ -109,7 +182,7 @@ async def home():
     return RedirectResponse(url="/docs")
 
 @app.post("/login-or-register")
-async def login_or_register(token:str):
+async def login_or_register(token:str, background_tasks: BackgroundTasks):
     '''
     This function is used to login or register a user using firebase ID Token.
     Not Tested
@@ -117,12 +190,14 @@ async def login_or_register(token:str):
     try:
         # Check if the token is valid
         user=firebase.verify_user_token(token)
-        response=supabase.fetch_user_data(user["uid"])
+        response=await db.fetch_user_data(user["uid"])
         if response:
+            # Resolve emergency contacts ahead of any SOS
+            background_tasks.add_task(warm_contacts, user["uid"])
             return JSONResponse(content={"message": "User verified successfully"}, status_code=200)
         else:
             # If the user does not exist, create a new user
-            supabase.insert_user_data(user["uid"],user["email"])
+            await db.insert_user_data(user["uid"],user["email"])
             return JSONResponse(content={"message": "User created successfully"}, status_code=200)
     
     except ValueError:
@@ -147,13 +222,14 @@ async def add_family_details(user_id: str, family_members: List[FamilyMember]):
         "family_members": family_member_dicts
     }
 
-    response = pinata.upload_to_pinata(data_dict)
+    response = await pinata.upload_to_pinata(data_dict)
 
     if response.status_code == 200:
             # Parse the JSON response
             res = response.json()["IpfsHash"]  # IPFS returns a hash for the stored data
             # Add the hash to the database
-            if(supabase.insert_emergency_contact_hash(user_id,res)):
+            if(await db.insert_emergency_contact_hash(user_id,res)):
+                contact_store.set(user_id, family_member_dicts)
                 return JSONResponse(content={"message": "Family details added successfully","response":res}, status_code=200)
             else:
                 return JSONResponse(content={"message":"Failed to add family details to supabase"},status_code=500)
@@ -167,13 +243,13 @@ async def get_family_details(user_id: str):
     This function is used to get the family details of a user.
     '''
     # Retrieve all hashes stored in Supabase
-    res = supabase.get_emergency_contact_hash(user_id)
+    res = await db.get_emergency_contact_hash(user_id)
     retrieved_data = []
 
     # Iterate through each hash and retrieve data from IPFS
     for record in res.data:
         ipfs_hash = record["emergency_contacts"]
-        retrieved_response = pinata.get_data_from_ipfs(ipfs_hash)
+        retrieved_response = await pinata.get_data_from_ipfs(ipfs_hash)
         
         # Check if data retrieval was successful
         if retrieved_response.status_code == 200:
@@ -208,16 +284,18 @@ async def report_incident(incident: Incident,uid:Optional[str]=None):
     except:
         data_dict["uid"]=None
 
-    response = pinata.upload_to_pinata(data_dict)
+    response = await pinata.upload_to_pinata(data_dict)
 
-    geofence=get_lat_long_opencage(location)
+    geofence=await get_lat_long_opencage(location)
     geofence["radius_meters"]=500
     
     if response.status_code == 200:
         res = response.json()["IpfsHash"]  # IPFS returns a hash for the stored data
         # Add the hash to the database
-        if(supabase.insert_ipfs_hash(res)):
-            if(supabase.insert_geofence(geofence)):
+        if(await db.insert_ipfs_hash(res)):
+            inserted=await db.insert_geofence(geofence)
+            if(inserted):
+                geofence_cache.add_rows(inserted.data)
                 return JSONResponse(content={"message":"Data inserted to IPFS and hash + geofence inserted to supabase","ipfs_hash": res},status_code=200)
             else:
                 return JSONResponse(content={"message":"Data inserted to IPFS and hash inserted to supabase. Failed to insert geofence coordinates","ipfs_hash": res},status_code=200)
@@ -229,43 +307,18 @@ async def report_incident(incident: Incident,uid:Optional[str]=None):
         return JSONResponse(content={"message":"Failed to insert data to Pinata","ipfs_hash": None,"error":response.text,"pinata_status_code":response.status_code},status_code=500)
 
 @app.get("/retrieve-incident")
-async def retrieve_incident():
+async def retrieve_incident(cursor: Optional[int]=None, limit: Optional[int]=None):
     '''
     For Admin
-    Retrieve all incidents from the database
+    Streams incidents from IPFS as NDJSON while they are fetched, one JSON object per line.
+    Pass the trailing next_cursor back as `cursor` to continue after `limit` incidents.
     '''
-    # Retrieve all hashes stored in Supabase
-    res = supabase.retrieve_hash()
-    retrieved_data = []
-
-    # Iterate through each hash and retrieve data from IPFS
-    for record in res.data:
-        ipfs_hash = record["hash"]
-        try:
-            retrieved_response = pinata.get_data_from_ipfs(ipfs_hash)
-            # Check if data retrieval was successful
-            if retrieved_response.status_code == 200:
-                data_dict = retrieved_response.json()
-                retrieved_data.append({
-                    "ipfs_hash": ipfs_hash,
-                    "data": data_dict
-                })
-            else:
-                retrieved_data.append({
-                    "ipfs_hash": ipfs_hash,
-                    "data": "Failed to retrieve data",
-                    "status_code": retrieved_response.status_code,
-                    "error": retrieved_response.text
-                })
-        except ConnectionError as e:
-            # Handle the connection error
-            raise HTTPException(status_code=500, detail="Failed to connect to IPFS")
-        except Exception as e:
-            # Handle any other exceptions
-            raise HTTPException(status_code=500, detail=str(e))
-
-    # Return all retrieved data in a single JSON response
-    return JSONResponse(content={"message": "Data retrieved from IPFS", "retrieved_data": retrieved_data}, status_code=200)
+    return StreamingResponse(
+        stream_incidents(db, pinata, cursor=cursor, limit=limit,
+                         concurrency=int(os.getenv("IPFS_FETCH_CONCURRENCY", "32")),
+                         timeout=float(os.getenv("IPFS_FETCH_TIMEOUT_SECONDS", "10"))),
+        media_type="application/x-ndjson",
+    )
 
 @app.post("/update_location")
 async def update_location(location: UserLocation):
@@ -273,17 +326,49 @@ async def update_location(location: UserLocation):
     Updates the location of the user and cross checks with the geofence corrdinates in the geofence database.
     '''
     user_location = (location.latitude, location.longitude)
-    geofences = supabase.get_geofence()
-    alerts_to_send = []
+    # Enter/exit state is kept in memory; transitions are persisted to geofence_alerts in the background
+    alerts_to_send, transitions = track_location(location.user_id, user_location)
+
+    return JSONResponse(content={"alerts": alerts_to_send, "transitions": transitions},status_code=200)
+
+@app.post("/update_location/batch")
+async def update_location_batch(batch: LocationBatch):
+    '''
+    Bulk version of /update_location for buffered or gateway-aggregated pings.
+    All pings are matched against the geofences in one vectorized pass; alerts are returned per user.
+    '''
+    # Matching is CPU bound and runs in a worker thread; the state replay stays on the event loop
+    pings, matches = await asyncio.to_thread(match_pings, [ping.model_dump() for ping in batch.pings])
+    alerts, transitions = replay_pings(pings, matches)
+    return JSONResponse(content={"alerts": alerts, "transitions": transitions},status_code=200)
 
-    for geofence in geofences:
-        if is_within_geofence(user_location, (geofence["center_lat"], geofence["center_long"]), geofence["radius_meters"]):
-            alerts_to_send.append(geofence)
-            # Check if alert has already been sent
-            if not has_alert_been_sent(location.user_id, geofence["id"]):
-                mark_alert_as_sent(location.user_id, geofence["id"])
+@app.get("/ready")
+async def ready():
+    '''
+    Readiness probe: 200 once the warm-up has finished successfully, 503 before that.
+    '''
+    return JSONResponse(content=warmup.status(), status_code=200 if warmup.ready else 503)
 
-    return JSONResponse(content={"alerts": alerts_to_send},status_code=200)
+@app.get("/stats")
+async def get_stats():
+    '''
+    For Admin
+    Runtime counters of the in-process caches and pipelines.
+    '''
+    return JSONResponse(content={
+        "location_pings": movement_filter.stats(),
+        "geofence_alerts": geofence_state.stats(),
+        "route_cache": ors.route_cache.stats(),
+        "geocode_cache": opencage.stats(),
+        "ipfs_cache": ipfs_cache.stats(),
+        "contact_store": contact_store.stats(),
+        "sos_outbox": sos_outbox.stats(),
+        "sos_coalescer": sos_coalescer.stats(),
+        "audio_inference": audio.scheduler.stats() if "audio" in clients.loaded() else None,
+        "audio_gate": energy_gate.stats(),
+        "audio_features": feature_executor.stats(),
+        "supabase": supabase_executor.stats(),
+    }, status_code=200)
 
 @app.post("/add-geofence")
 async def add_geofence(geofence: Geofence):
@@ -293,10 +378,11 @@ async def add_geofence(geofence: Geofence):
     '''
     try:
         data=geofence.model_dump()
-        loc=get_lat_long_opencage(data["location"])
+        loc=await get_lat_long_opencage(data["location"])
         loc["radius_meters"]=data["radius_meters"]
-        response=supabase.insert_geofence(loc)
+        response=await db.insert_geofence(loc)
         if response:
+            geofence_cache.add_rows(response.data)
             return JSONResponse(content={"message": "Geofence added successfully"}, status_code=200)
         else:
             return JSONResponse(content={"message": "Failed to add geofence"}, status_code=400)
@@ -308,9 +394,9 @@ async def add_geofence(geofence: Geofence):
 async def get_geofence_coordinates():
     '''
     For Admin
-    Retrieves all geofence coordinates from the Supabase database.
+    Retrieves all geofence coordinates from the shared geofence cache.
     '''
-    geofences = supabase.get_geofence()
+    geofences = geofence_cache.geofences()
     return JSONResponse(content={"geofences": geofences}, status_code=200)
 
 @app.post("/safe_route")
@@ -318,17 +404,17 @@ async def safe_route(start:str, end:str):
     """
     To get a safe route between start and end points.
     """
-    loc=get_lat_long_opencage(start)
+    loc=await get_lat_long_opencage(start)
     start_lat=loc["center_lat"]
     start_lon=loc["center_long"]
-    loc=get_lat_long_opencage(end)
+    loc=await get_lat_long_opencage(end)
     end_lat=loc["center_lat"]
     end_lon=loc["center_long"]
     start_coords = (start_lat, start_lon)
     end_coords = (end_lat, end_lon)
     
     # Get the safest route after removing geofenced coordinates
-    safe_route = ors.get_safest_route(start_coords, end_coords)
+    safe_route = await ors.get_safest_route(start_coords, end_coords)
     
     if not safe_route:
         raise HTTPException(status_code=404, detail="Safe route could not be found.")
@@ -336,24 +422,11 @@ async def safe_route(start:str, end:str):
     return JSONResponse(content={"message":"Shortest route calculated","safe_route":safe_route},status_code=200)
 
 @app.post("/sos-trigger")
-async def trigger_sos(user_id: str, latitude:float, longitude:float, username:str, background_tasks: BackgroundTasks):
+async def trigger_sos(user_id: str, latitude:float, longitude:float, username:str):
     '''
     Triggers an SOS event.
     '''
-    alert_data={
-        "user_id":user_id,
-        "latitude":latitude,
-        "longitude":longitude,
-    }
-    sos_alert_id = (supabase.insert_sos_alerts(alert_data)).data
-    sos_alert_id=sos_alert_id[0]["id"]
-    user={
-        "user_id":user_id,
-        "username":username,
-        "latitude":latitude,
-        "longitude":longitude
-    }
-    background_tasks.add_task(notify_contacts, user)
+    sos_alert_id = await trigger_sos_logic(user_id, latitude, longitude, username)
     return {"message": "SOS alert triggered", "alert_id": sos_alert_id}
 
 @app.get("/sos-alert/{user_id}/{alert_id}")
@@ -362,8 +435,8 @@ async def get_sos_data(user_id:str, alert_id: int):
     For Admin
     Retrieves SOS alert data from the Supabase database.
     '''
-    res=supabase.get_sos_alerts(alert_id)[0]
-    rec_url,audio_url=supabase.get_recording_URL(alert_id,user_id)
+    res=(await db.get_sos_alerts(alert_id))[0]
+    rec_url,audio_url=await db.get_recording_URL(alert_id,user_id)
     res["video_stream_url"]=rec_url
     res["audio_stream_url"]=audio_url
     if not res:
@@ -399,76 +472,89 @@ async def stream_media(websocket: WebSocket, user_id: str, alert_id: int, file_f
                         "message":"Failed to transmit video"
                     })
 
+def session_features(stream: AudioStream, data: bytes):
+    # Model input for the latest window, or None until a hop of new audio has arrived or when the gate skipped it
+    return stream.features() if stream.feed(data) is not None else None
+
 @app.websocket("/ws/audio-stream/{user_id}/{username}/{latitude}/{longitude}")
 async def stream_media(websocket: WebSocket, user_id: str, latitude: float, longitude: float, username: str, background_tasks: BackgroundTasks):
     """
     WebSocket endpoint to analyze the real-time audio from user device
     """
     await websocket.accept()
-    file_name = f"{user_id}.wav"
-    local_path = f"{file_name}"
+    # Only the latest window of audio is kept, in memory
+    window_seconds=float(os.getenv("AUDIO_WINDOW_SECONDS", "2.0"))
+    stream = AudioStream(
+        window_seconds=window_seconds,
+        hop_seconds=float(os.getenv("AUDIO_HOP_SECONDS", "0.5")),
+        # MFCC frames are computed once, as the audio arrives
+        extractor=StreamingMFCC(window_frames=1 + int(window_seconds * 16000) // 512),
+        # Silent or background-only windows are not classified
+        gate=energy_gate
+    )
 
     try:
-        # Open a file for writing the incoming stream data
-        async with aiofiles.open(local_path, 'wb') as out_file:
-            while True:
-                try:
-                    data = await websocket.receive_bytes()
-                    print("Received data chunk:", len(data))
-
-                    await out_file.write(data)
+        while True:
+            try:
+                data = await websocket.receive_bytes()
+                print("Received data chunk:", len(data))
 
-                    # Ensure the file is flushed and ready for processing
-                    await out_file.flush()
-                    print("Audio file received from client")
+                try:
+                    # Decoding and feature extraction run off the event loop, in their own bounded pool
+                    features = await feature_executor.run(session_features, stream, data)
+                    # Classify the latest window once a hop of new audio has arrived
+                    res = await audio.process_features_async(features) if features is not None else None
+                except InferenceBusy:
+                    # Feature extraction or inference is saturated: tell the client this window was not analysed
+                    await websocket.send_json({
+                        "sos_triggered": False,
+                        "backpressure": True,
+                        "message": "Server busy, audio window skipped."
+                    })
+                    continue
+                print(res)
 
-                    # Process the audio only when the file is ready
-                    res = audio.process_audio(local_path)
-                    print(res)
+                if res == 'Scream':
+                    print("SOS detected...")
 
-                    if res == 'Scream':
-                        # File should only be deleted after it's completely processed
-                        print("SOS detected...")
+                    # Send notification to frontend
+                    await websocket.send_json({
+                        "sos_triggered": None,
+                        "message": "Potential SOS detected! Please confirm if help is needed."
+                    })
 
-                        # Send notification to frontend
-                        await websocket.send_json({
-                            "sos_triggered": None,
-                            "message": "Potential SOS detected! Please confirm if help is needed."
-                        })
+                    response = await websocket.receive_json()
+                    print("Response from client:", response)
 
-                        response = await websocket.receive_json()
-                        print("Response from client:", response)
-
-                        if response.get('action') == 'trigger_sos':
-                                    print("SOS action triggered by the client.")
-                                    sos_alert_id = await trigger_sos_logic(user_id, latitude, longitude, username, background_tasks)
-                                    await websocket.send_json({
-                                        "sos_triggered": True,
-                                        "alert_id": sos_alert_id,
-                                        "message": "SOS alert has been triggered, help is on the way!"
-                                    })
-
-                        else:
-                            print("No SOS action from the client.")
-                            await websocket.send_json({
-                                "sos_triggered": False,
-                                "message": "No SOS triggered. Everything is safe."
-                            })
+                    if response.get('action') == 'trigger_sos':
+                                print("SOS action triggered by the client.")
+                                sos_alert_id = await trigger_sos_logic(user_id, latitude, longitude, username)
+                                await websocket.send_json({
+                                    "sos_triggered": True,
+                                    "alert_id": sos_alert_id,
+                                    "message": "SOS alert has been triggered, help is on the way!"
+                                })
 
                     else:
-                        print("Safe surroundings...")
-                        # os.remove(local_path)
+                        print("No SOS action from the client.")
                         await websocket.send_json({
                             "sos_triggered": False,
-                            "message": "Everything is safe."
+                            "message": "No SOS triggered. Everything is safe."
                         })
 
-                except WebSocketDisconnect:
-                    print("WebSocket connection closed.")
-                    break
+                else:
+                    print("Safe surroundings...")
+                    await websocket.send_json({
+                        "sos_triggered": False,
+                        "message": "Everything is safe."
+                    })
+
+            except WebSocketDisconnect:
+                print("WebSocket connection closed.")
+                break
     except Exception as e:
         await websocket.close()
-        return JSONResponse(content={"message": f"Error writing file: {e}"}, status_code=500)
+        return JSONResponse(content={"message": f"Error processing audio stream: {e}"}, status_code=500)
 
 if __name__=="__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,75 @@
+import threading
+
+class ClientRegistry:
+    '''
+    One shared instance per external client (Supabase, Firebase, Twilio, ...) for the whole process.
+
+    Clients are built on first use by their factory, so importing a module that needs a client does not
+    pay for the client library import or its connection setup.
+    '''
+    def __init__(self):
+        self._factories = {}
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, factory):
+        self._factories[name] = factory
+        return LazyClient(self, name)
+
+    def get(self, name):
+        client = self._clients.get(name)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(name)
+                if client is None:
+                    client = self._clients[name] = self._factories[name]()
+        return client
+
+    def loaded(self):
+        return sorted(self._clients)
+
+class LazyClient:
+    '''
+    Stand-in for a registered client: attribute access builds the client if needed and forwards to it.
+    '''
+    def __init__(self, registry, name):
+        self._registry = registry
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(self._registry.get(self._name), attr)
+
+    def __repr__(self):
+        return f"<LazyClient {self._name}>"
+
+def _supabase():
+    from src.database.supabase_config import Supabase
+    return Supabase()
+
+def _firebase():
+    from src.database.firebase_config import Firebase
+    return Firebase()
+
+def _pinata():
+    from src.services.pinata_config import Pinata
+    return Pinata()
+
+def _whatsapp():
+    from src.services.whatsapp_config import WhatsApp
+    return WhatsApp()
+
+def _twilio():
+    from src.services.twilio_config import Twilio
+    return Twilio()
+
+def _audio():
+    from src.pipelines.audio_processing import Audio_Processing
+    return Audio_Processing()
+
+clients = ClientRegistry()
+supabase = clients.register("supabase", _supabase)
+firebase = clients.register("firebase", _firebase)
+pinata = clients.register("pinata", _pinata)
+whatsapp = clients.register("whatsapp", _whatsapp)
+twilio = clients.register("twilio", _twilio)
+audio = clients.register("audio", _audio)
@@ -0,0 +1,160 @@
+import json, os, sqlite3, threading, time
+from src.utils.cache import LRUCache
+from src.utils.logger import logging
+
+async def resolve_contacts(db, pinata, user_id):
+    '''
+    Remote lookup of a user's emergency contacts: the contact hash from Supabase, then the contact list from IPFS.
+    Returns the list of family members, an empty list if the user has not added any, or None if a lookup
+    failed (so callers can retry instead of treating the user as having no contacts).
+    '''
+    res = await db.get_emergency_contact_hash(user_id)
+    if res is None:
+        return None
+
+    for record in res.data:
+        ipfs_hash = record["emergency_contacts"]
+        if not ipfs_hash:
+            return []
+        retrieved_response = await pinata.get_data_from_ipfs(ipfs_hash)
+
+        # Check if data retrieval was successful
+        if retrieved_response.status_code == 200:
+            data_dict = retrieved_response.json()
+            return data_dict["family_members"]
+        else:
+            return None
+    return []
+
+class ContactStore:
+    '''
+    Hot store of resolved emergency contacts, so an SOS can be dispatched without any remote reads.
+
+    Entries are written when /family_details is saved and refreshed at every login. By default they live
+    only in this process's in-memory LRU and are lost on restart; when `path` is set they are also kept in
+    a local SQLite file, so they survive restarts and are shared by workers on the same host.
+
+    Contacts can change outside this process (another worker, or Supabase directly), so an entry is only
+    served by get() for `ttl` seconds after it was resolved; after that callers resolve it again.
+    get(user_id, allow_stale=True) still returns an expired entry, as a fallback for when that remote
+    lookup fails during an SOS.
+    '''
+    def __init__(self, path=None, max_entries=100000, ttl=600):
+        # Values are (contacts, resolved_at) so expired entries stay available as a fallback
+        self.memory = LRUCache(max_entries=max_entries)
+        self.ttl = ttl
+        self.path = path
+        self.stale_served = 0
+        self._db = None
+        self._db_lock = threading.Lock()
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS contacts (user_id TEXT PRIMARY KEY, contacts TEXT, updated_at REAL)")
+            self._db.commit()
+
+    def get(self, user_id, allow_stale=False):
+        entry = self.memory.get(user_id)
+        if entry is None:
+            entry = self._load(user_id)
+            if entry is not None:
+                self.memory.set(user_id, entry)
+        if entry is None:
+            return None
+        contacts, resolved_at = entry
+        if time.time() - resolved_at <= self.ttl:
+            return contacts
+        if allow_stale:
+            self.stale_served += 1
+            return contacts
+        return None
+
+    def set(self, user_id, contacts):
+        entry = (contacts, time.time())
+        self.memory.set(user_id, entry)
+        self._store(user_id, entry)
+
+    async def warm(self, db, pinata, user_id):
+        '''
+        Resolve the contacts of a user again and store them, replacing any cached entry. Failures are only
+        logged and leave the cached entry in place.
+        '''
+        try:
+            contacts = await resolve_contacts(db, pinata, user_id)
+        except Exception as e:
+            logging.error(f"Failed to warm emergency contacts of {user_id}: {e}")
+            return
+        if contacts is not None:
+            self.set(user_id, contacts)
+
+    def _load(self, user_id):
+        if self._db is None:
+            return None
+        with self._db_lock:
+            row = self._db.execute("SELECT contacts, updated_at FROM contacts WHERE user_id = ?", (user_id,)).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def _store(self, user_id, entry):
+        if self._db is None:
+            return
+        contacts, resolved_at = entry
+        try:
+            with self._db_lock:
+                self._db.execute("INSERT OR REPLACE INTO contacts VALUES (?, ?, ?)", (user_id, json.dumps(contacts), resolved_at))
+                self._db.commit()
+        except sqlite3.Error as e:
+            logging.error(f"Failed to persist emergency contacts of {user_id}: {e}")
+
+    def stats(self):
+        return {**self.memory.stats(), "ttl": self.ttl, "persistent": self._db is not None, "stale_served": self.stale_served}
+
+contact_store = ContactStore(
+    path=os.getenv("CONTACT_STORE_PATH") or None,
+    max_entries=int(os.getenv("CONTACT_STORE_MAX_ENTRIES", "100000")),
+    ttl=float(os.getenv("CONTACT_STORE_TTL_SECONDS", "600")),
+)
+
+if __name__=="__main__":
+    import asyncio, statistics
+
+    # Simulated remote latencies: Supabase round trip, IPFS gateway fetch and the first WhatsApp send
+    SUPABASE_MS, IPFS_MS, SEND_MS = 80, 350, 120
+    contacts = [{"name": "A", "relation": "Mother", "phone_number": "+910000000000"}]
+
+    class _Response:
+        status_code = 200
+        def __init__(self, data):
+            self.data = data
+        def json(self):
+            return self.data
+
+    class _DB:
+        async def get_emergency_contact_hash(self, user_id):
+            await asyncio.sleep(SUPABASE_MS / 1000)
+            return _Response([{"emergency_contacts": "QmHash"}])
+
+    class _Pinata:
+        async def get_data_from_ipfs(self, ipfs_hash):
+            await asyncio.sleep(IPFS_MS / 1000)
+            return _Response({"family_members": contacts})
+
+    async def time_to_first_notification(lookup):
+        start = time.perf_counter()
+        found = await lookup()
+        await asyncio.sleep(SEND_MS / 1000)
+        assert found == contacts
+        return (time.perf_counter() - start) * 1000
+
+    async def main():
+        store = ContactStore()
+        db, pinata = _DB(), _Pinata()
+        before = [await time_to_first_notification(lambda: resolve_contacts(db, pinata, "user")) for _ in range(5)]
+        await store.warm(db, pinata, "user")
+
+        async def hot():
+            return store.get("user")
+
+        after = [await time_to_first_notification(hot) for _ in range(5)]
+        print(f"Time to first notification, remote lookup: {statistics.median(before):.1f} ms")
+        print(f"Time to first notification, hot store:     {statistics.median(after):.1f} ms")
+
+    asyncio.run(main())
@@ -0,0 +1,120 @@
+import asyncio, bisect, os, threading, time
+from concurrent.futures import ThreadPoolExecutor
+
+class LatencyHistogram:
+    '''
+    Fixed-bucket latency histogram in milliseconds.
+    '''
+    BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect.bisect_left(self.BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, q):
+        '''
+        Upper bound of the bucket holding the q-th percentile.
+        '''
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.BUCKETS_MS + (float("inf"),), self.counts):
+            seen += count
+            if seen >= target:
+                return bound if bound != float("inf") else self.max_ms
+        return self.max_ms
+
+    def stats(self):
+        return {
+            "count": self.count,
+            "mean_ms": self.total_ms / self.count if self.count else None,
+            "p50_ms": self.percentile(0.5),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": self.max_ms,
+            "buckets_ms": dict(zip([str(b) for b in self.BUCKETS_MS] + ["inf"], self.counts)),
+        }
+
+class SupabaseExecutor:
+    '''
+    Dedicated, bounded thread pool for blocking Supabase calls.
+
+    At most `max_workers` queries run at once and at most `max_pending` may be submitted; further callers
+    wait on a semaphore instead of piling work into the pool. Tracks queue depth and per-method latency.
+    '''
+    def __init__(self, max_workers=16, max_pending=256):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="supabase")
+        self._slots = None
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.histograms = {}
+
+    def _timed(self, name, func, args, kwargs):
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            with self._lock:
+                self.running -= 1
+                self.histograms.setdefault(name, LatencyHistogram()).observe(elapsed)
+
+    async def run(self, name, func, *args, **kwargs):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        async with self._slots:
+            with self._lock:
+                self.queued += 1
+            return await asyncio.get_running_loop().run_in_executor(self.pool, self._timed, name, func, args, kwargs)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "queued": self.queued,
+                "running": self.running,
+                "methods": {name: histogram.stats() for name, histogram in self.histograms.items()},
+            }
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False)
+
+supabase_executor = SupabaseExecutor(
+    max_workers=int(os.getenv("SUPABASE_MAX_WORKERS", "16")),
+    max_pending=int(os.getenv("SUPABASE_MAX_PENDING", "256")),
+)
+
+class AsyncSupabase:
+    '''
+    Async facade over the Supabase class: `await db.get_sos_alerts(id)` runs Supabase.get_sos_alerts
+    on the shared Supabase executor so database round trips never block the event loop.
+    '''
+    def __init__(self, client, executor=supabase_executor):
+        self.client = client
+        self.executor = executor
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if not callable(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            return await self.executor.run(name, attr, *args, **kwargs)
+
+        call.__name__ = name
+        setattr(self, name, call)
+        return call
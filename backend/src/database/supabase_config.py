@@ -121,6 +121,26 @@ class Supabase:
             logging.error(f"Error fetching hashes from supabase.")
             return None
         
+    def retrieve_hash_page(self,after_id=None,limit=500):
+        '''
+        Retrieve one page of ipfs hashes from supabase, ordered by id, starting after the given id
+        '''
+        try:
+            query = (
+                        self.supabase.table("incident_reporting")
+                        .select("*")
+                        .order("id")
+                        .limit(limit)
+                        )
+            if after_id is not None:
+                query = query.gt("id", after_id)
+            response = query.execute()
+            logging.info(f"Fetched page of hashes from supabase.")
+            return response
+        except:
+            logging.error(f"Error fetching page of hashes from supabase.")
+            return None
+        
     def insert_geofence(self,fence):
         '''
         Insert geofence into supabase
@@ -152,6 +172,24 @@ class Supabase:
             logging.error(f"Error fetching geofences from supabase.")
             return None
     
+    def get_geofence_since(self,last_id):
+        '''
+        Retrieve geofences added after the given id from supabase
+        '''
+        try:
+            response = (
+                        self.supabase.table("geofences")
+                        .select("*")
+                        .gt("id", last_id)
+                        .order("id")
+                        .execute()
+                        )
+            logging.info(f"Fetched new geofences from supabase.")
+            return response.data
+        except:
+            logging.error(f"Error fetching new geofences from supabase.")
+            return None
+    
     def insert_geofence_alerts(self,alert):
         '''
         Insert geofence alerts into supabase
@@ -176,11 +214,11 @@ class Supabase:
                         self.supabase.table("geofence_alerts")
                         .select("*")
                         .eq("uid", uid)
+                        .eq("geofence_id", geofence_id)
                         .execute()
                         )
             logging.info(f"Fetched geofence alerts from supabase.")
-            alerts=response.data
-            return [alert for alert in alerts if alert['geofence_id'] == geofence_id]
+            return response.data
         except:
             logging.error(f"Error fetching geofence alerts from supabase.")
             print(f"Error fetching geofence alerts from supabase.")
@@ -201,6 +239,22 @@ class Supabase:
             logging.error(f"Error inserting alerts into supabase: {e}")
             return None
     
+    def update_sos_alert_location(self,id,latitude,longitude):
+        '''
+        Update the location of an existing sos alert
+        '''
+        try:
+            response = (self.supabase.table("sos_alerts")
+                        .update({"latitude":latitude,"longitude":longitude})
+                        .eq("id", id)
+                        .execute()
+                        )
+            logging.info(f"Updated sos alert location in supabase.")
+            return response
+        except Exception as e:
+            logging.error(f"Error updating sos alert location in supabase: {e}")
+            return None
+    
     def get_sos_alerts(self,id):
         '''
         Retrieve alerts from supabase
@@ -0,0 +1,154 @@
+import json, threading
+from src.geofence_index import GeofenceIndex
+from src.utils.logger import logging
+
+class GeofenceCache:
+    '''
+    In-process copy of the geofences table shared by every reader.
+
+    The table is loaded once, then refreshed incrementally in a background thread by fetching only
+    rows with an id above the last synced one. Writers that insert geofences patch the cache
+    synchronously, and every change bumps `version` so dependent caches can tell when to rebuild.
+    A full reload runs every `full_reload_every` refreshes to pick up deleted or edited rows; it only
+    swaps the index and bumps `version` when a row was added, removed or edited.
+    '''
+    def __init__(self, client, refresh_interval=30, full_reload_every=20, cell_size_deg=0.01, padding_meters=0.0):
+        self.client = client
+        self.refresh_interval = refresh_interval
+        self.full_reload_every = full_reload_every
+        self.cell_size_deg = cell_size_deg
+        self.padding_meters = padding_meters
+        self.version = 0
+        self.last_id = None
+        self.index = GeofenceIndex(cell_size_deg=cell_size_deg, padding_meters=padding_meters)
+        # Content digest of every cached row by id, to tell whether a full reload changed anything
+        self._digests = {}
+        self._load_attempted = False
+        self._lock = threading.Lock()
+        self._refresher = None
+        self._stop = threading.Event()
+
+    @staticmethod
+    def _digest(row):
+        return hash(json.dumps(row, sort_keys=True, default=str))
+
+    def _new_index(self, rows):
+        return GeofenceIndex(rows, cell_size_deg=self.cell_size_deg, padding_meters=self.padding_meters)
+
+    def load(self):
+        '''
+        Full load of the geofences table. Readers keep using the old index until the new one is swapped in.
+        '''
+        rows = self.client.get_geofence()
+        if rows is None:
+            logging.error("Geofence cache load failed, keeping the previous snapshot.")
+            return False
+        digests = {row["id"]: self._digest(row) for row in rows}
+        if self.version and digests == self._digests:
+            # Same rows as the current snapshot: keep it, so version-keyed caches stay valid
+            logging.info(f"Geofence cache reload found no changes (version {self.version}).")
+            return True
+        index = self._new_index(rows)
+        with self._lock:
+            self.index = index
+            self._digests = digests
+            self.last_id = max(digests, default=None)
+            self.version += 1
+        logging.info(f"Geofence cache loaded {len(rows)} geofences (version {self.version}).")
+        return True
+
+    def ensure_loaded(self):
+        '''
+        Blocking first load for readers that arrive before start(). Failed loads are retried by the refresher, not by readers.
+        '''
+        if not self._load_attempted:
+            self._load_attempted = True
+            self.load()
+
+    def refresh(self):
+        '''
+        Incremental sync: fetch only the rows added since the last sync.
+        '''
+        if self.last_id is None:
+            return self.load()
+        rows = self.client.get_geofence_since(self.last_id)
+        if rows is None:
+            return False
+        self.add_rows(rows)
+        return True
+
+    def add_rows(self, rows):
+        '''
+        Patch the cache with freshly inserted geofence rows. Rows already present are ignored.
+        '''
+        with self._lock:
+            added = 0
+            for row in rows or []:
+                if row.get("id") in self._digests:
+                    continue
+                # Readers iterate the index without the lock; appending to it is safe under the GIL
+                self.index.add(row)
+                self._digests[row["id"]] = self._digest(row)
+                if self.last_id is None or row["id"] > self.last_id:
+                    self.last_id = row["id"]
+                added += 1
+            if added:
+                self.version += 1
+        return added
+
+    def invalidate(self):
+        '''
+        Drop incremental state and reload the whole table.
+        '''
+        return self.load()
+
+    def geofences(self):
+        '''
+        Current geofence rows.
+        '''
+        self.ensure_loaded()
+        return [geofence for _, _, _, geofence in self.index.geofences]
+
+    def within(self, location):
+        self.ensure_loaded()
+        return self.index.within(location)
+
+    def query(self, location, margin_meters=0.0):
+        self.ensure_loaded()
+        return self.index.query(location, margin_meters)
+
+    def query_with_clearance(self, location, margin_meters=0.0):
+        self.ensure_loaded()
+        return self.index.query_with_clearance(location, margin_meters)
+
+    def query_many(self, locations, margin_meters=0.0):
+        self.ensure_loaded()
+        return self.index.query_many(locations, margin_meters)
+
+    def _run(self):
+        refreshes = 0
+        while not self._stop.wait(self.refresh_interval):
+            refreshes += 1
+            try:
+                if self.full_reload_every and refreshes % self.full_reload_every == 0:
+                    self.load()
+                else:
+                    self.refresh()
+            except Exception as e:
+                logging.error(f"Geofence cache refresh failed: {e}")
+
+    def start(self):
+        '''
+        Load the table and start the background refresher thread.
+        '''
+        self.ensure_loaded()
+        if self._refresher is None:
+            self._stop.clear()
+            self._refresher = threading.Thread(target=self._run, name="geofence-cache", daemon=True)
+            self._refresher.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._refresher is not None:
+            self._refresher.join(timeout=1)
+            self._refresher = None
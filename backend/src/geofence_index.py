@@ -0,0 +1,251 @@
+import math, random, time
+import numpy as np
+from geopy.distance import geodesic
+
+# Shortest length of one degree of latitude (at the equator) and of longitude at the equator.
+# Using the lower bound for latitude keeps the bounding boxes conservative.
+METERS_PER_DEG_LAT = 110574.0
+METERS_PER_DEG_LON = 111320.0
+EARTH_RADIUS_METERS = 6371008.8
+# Relative haversine vs. WGS84 geodesic error bound (measured worst case is ~0.56%).
+# Bulk matches whose haversine distance lies within this band of a boundary are re-checked with geodesic.
+HAVERSINE_TOLERANCE = 0.006
+
+def haversine_meters(lat1, lon1, lat2, lon2):
+    '''
+    Great-circle distance in meters on the mean Earth sphere.
+    Differs from the WGS84 geodesic used by is_within_geofence by at most ~0.56%.
+    '''
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * math.asin(min(1.0, math.sqrt(a)))
+
+class GeofenceIndex:
+    '''
+    Uniform grid index over circular geofences.
+
+    Every geofence is registered in each grid cell its bounding box overlaps, so a ping only
+    has to look at the fences registered in its own cell. Fences that are too large to bucket
+    (or that reach a pole) are kept in an overflow list which is always checked.
+    The final inside/outside decision uses the same geodesic distance as is_within_geofence.
+    '''
+    def __init__(self, geofences=(), cell_size_deg=0.01, padding_meters=0.0, max_cells_per_fence=4096):
+        self.cell_size_deg = cell_size_deg
+        self.padding_meters = padding_meters
+        self.max_cells_per_fence = max_cells_per_fence
+        self.n_cols = int(math.ceil(360.0 / cell_size_deg))
+        self.buckets = {}
+        self.overflow = []
+        self.geofences = []
+        self._arrays = None
+        for geofence in geofences:
+            self.add(geofence)
+
+    def __len__(self):
+        return len(self.geofences)
+
+    def _cell(self, lat, lon):
+        row = int(math.floor((lat + 90.0) / self.cell_size_deg))
+        col = int(math.floor((lon + 180.0) / self.cell_size_deg)) % self.n_cols
+        return row, col
+
+    def add(self, geofence):
+        '''
+        Register a geofence row (center_lat, center_long, radius_meters) in the index.
+        '''
+        lat = float(geofence["center_lat"])
+        lon = float(geofence["center_long"])
+        # 1% slack covers the ellipsoid vs. sphere difference of the bounding box maths
+        reach = (float(geofence["radius_meters"]) + self.padding_meters) * 1.01
+        slot = len(self.geofences)
+        self.geofences.append((lat, lon, float(geofence["radius_meters"]), geofence))
+        self._arrays = None
+
+        dlat = reach / METERS_PER_DEG_LAT
+        lat_max = min(abs(lat) + dlat, 90.0)
+        cos_lat = math.cos(math.radians(lat_max))
+        if lat_max >= 89.0 or cos_lat <= 0:
+            self.overflow.append(slot)
+            return
+        dlon = reach / (METERS_PER_DEG_LON * cos_lat)
+        if dlon >= 180.0:
+            self.overflow.append(slot)
+            return
+
+        row_min, col_min = self._cell(max(lat - dlat, -90.0), lon - dlon)
+        row_max, col_max = self._cell(min(lat + dlat, 90.0), lon + dlon)
+        # Longitude wraps around the antimeridian
+        n_cols = (col_max - col_min) % self.n_cols + 1
+        if (row_max - row_min + 1) * n_cols > self.max_cells_per_fence:
+            self.overflow.append(slot)
+            return
+        for row in range(row_min, row_max + 1):
+            for i in range(n_cols):
+                self.buckets.setdefault((row, (col_min + i) % self.n_cols), []).append(slot)
+
+    def candidates(self, location):
+        '''
+        Slots of the geofences whose bounding box covers the cell of the given (lat, lon).
+        '''
+        bucket = self.buckets.get(self._cell(location[0], location[1]), [])
+        if not self.overflow:
+            return bucket
+        return bucket + self.overflow
+
+    def query(self, location, margin_meters=0.0):
+        '''
+        Returns (geofence, distance_meters) for every geofence whose boundary (grown by margin_meters)
+        contains the location. margin_meters must not exceed the padding the index was built with.
+        '''
+        return self.query_with_clearance(location, margin_meters)[0]
+
+    def query_with_clearance(self, location, margin_meters=0.0):
+        '''
+        Like query(), but also returns a lower bound (meters) on the distance from the location to the nearest
+        geofence boundary (radius or radius + margin_meters) or grid cell edge. Any position closer than that
+        to the location gets exactly the same matches.
+        '''
+        lat, lon = location
+        matches = []
+        clearance = self._cell_clearance(lat, lon)
+        for slot in self.candidates(location):
+            f_lat, f_lon, radius, geofence = self.geofences[slot]
+            limit = radius + margin_meters
+            # Cheap spherical rejection before the exact ellipsoidal distance
+            approx = haversine_meters(lat, lon, f_lat, f_lon)
+            if approx > limit * 1.01:
+                clearance = min(clearance, approx / 1.01 - limit)
+                continue
+            distance = geodesic(location, (f_lat, f_lon)).meters
+            clearance = min(clearance, abs(distance - radius), abs(distance - limit))
+            if distance <= limit:
+                matches.append((geofence, distance))
+        return matches, max(clearance, 0.0)
+
+    def _cell_clearance(self, lat, lon):
+        '''
+        Conservative distance in meters from a point to the edge of its grid cell.
+        Fences outside the cell's bucket cannot reach any point inside the cell.
+        '''
+        size = self.cell_size_deg
+        row_lat = math.floor((lat + 90.0) / size) * size - 90.0
+        col_lon = math.floor((lon + 180.0) / size) * size - 180.0
+        d_lat = min(lat - row_lat, row_lat + size - lat) * METERS_PER_DEG_LAT
+        poleward = min(max(abs(row_lat), abs(row_lat + size)), 90.0)
+        d_lon = min(lon - col_lon, col_lon + size - lon) * METERS_PER_DEG_LON * math.cos(math.radians(poleward))
+        return max(min(d_lat, d_lon), 0.0)
+
+    def within(self, location):
+        '''
+        Returns the geofences that contain the location, same semantics as is_within_geofence.
+        '''
+        return [geofence for geofence, _ in self.query(location)]
+
+    def arrays(self):
+        '''
+        Fence centers (radians) and radii as NumPy arrays sorted by latitude, built lazily for bulk queries.
+        '''
+        arrays = self._arrays
+        if arrays is None:
+            lats = np.array([g[0] for g in self.geofences], dtype=np.float64)
+            lons = np.array([g[1] for g in self.geofences], dtype=np.float64)
+            radii = np.array([g[2] for g in self.geofences], dtype=np.float64)
+            order = np.argsort(lats, kind="stable")
+            arrays = self._arrays = (lats[order], np.radians(lats[order]), np.radians(lons[order]), radii[order], order)
+        return arrays
+
+    def query_many(self, locations, margin_meters=0.0, chunk_size=32):
+        '''
+        Vectorized equivalent of query() for many (lat, lon) locations at once.
+
+        Pings are sorted by latitude and processed in chunks; each chunk is compared with a haversine
+        distance matrix against the latitude slice of fences that can reach it. Pairs whose haversine
+        distance is within HAVERSINE_TOLERANCE of the radius (or of radius + margin_meters) are re-checked
+        with geodesic, so inside/outside decisions are identical to is_within_geofence. Reported distances
+        are exact near boundaries and within HAVERSINE_TOLERANCE (relative) elsewhere.
+        Returns one list of (geofence, distance_meters) per location.
+        '''
+        results = [[] for _ in locations]
+        if len(locations) == 0 or not self.geofences:
+            return results
+        f_lats_deg, f_lats, f_lons, f_radii, f_slots = self.arrays()
+        points = np.asarray(locations, dtype=np.float64).reshape(-1, 2)
+        p_lats_deg = points[:, 0]
+        p_lats = np.radians(p_lats_deg)
+        p_lons = np.radians(points[:, 1])
+        reach_deg = (float(f_radii.max()) + margin_meters) * (1 + HAVERSINE_TOLERANCE) / METERS_PER_DEG_LAT
+        order = np.argsort(p_lats_deg, kind="stable")
+
+        for start in range(0, len(order), chunk_size):
+            rows = order[start:start + chunk_size]
+            lo = np.searchsorted(f_lats_deg, p_lats_deg[rows].min() - reach_deg, side="left")
+            hi = np.searchsorted(f_lats_deg, p_lats_deg[rows].max() + reach_deg, side="right")
+            if lo >= hi:
+                continue
+            lat1 = p_lats[rows][:, None]
+            lat2 = f_lats[lo:hi][None, :]
+            dlat = lat2 - lat1
+            dlon = f_lons[lo:hi][None, :] - p_lons[rows][:, None]
+            a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+            distances = 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+            radii = f_radii[lo:hi][None, :]
+            hit_rows, hit_cols = np.nonzero(distances <= (radii + margin_meters) * (1 + HAVERSINE_TOLERANCE))
+
+            for r, c in zip(hit_rows.tolist(), hit_cols.tolist()):
+                point = rows[r]
+                f_lat, f_lon, radius, geofence = self.geofences[f_slots[lo + c]]
+                distance = float(distances[r, c])
+                for boundary in (radius, radius + margin_meters):
+                    if boundary * (1 - HAVERSINE_TOLERANCE) <= distance <= boundary * (1 + HAVERSINE_TOLERANCE):
+                        distance = geodesic(tuple(points[point]), (f_lat, f_lon)).meters
+                        break
+                if distance <= radius + margin_meters:
+                    results[point].append((geofence, distance))
+        return results
+
+# Benchmark
+if __name__=="__main__":
+    random.seed(7)
+    n_fences = 100000
+    n_pings = 2000
+    # Fences scattered over a ~250 km x 250 km metro region
+    lat0, lon0, span = 12.9, 77.6, 2.25
+    fences = [{
+        "id": i,
+        "center_lat": lat0 + random.uniform(-span / 2, span / 2),
+        "center_long": lon0 + random.uniform(-span / 2, span / 2),
+        "radius_meters": random.uniform(50, 1000),
+    } for i in range(n_fences)]
+    pings = [(lat0 + random.uniform(-span / 2, span / 2), lon0 + random.uniform(-span / 2, span / 2)) for _ in range(n_pings)]
+
+    start = time.perf_counter()
+    index = GeofenceIndex(fences)
+    print(f"Index build for {n_fences} fences: {(time.perf_counter() - start) * 1000:.1f} ms, {len(index.buckets)} cells")
+
+    timings = []
+    for ping in pings:
+        start = time.perf_counter()
+        index.within(ping)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    print(f"Indexed per-ping latency: mean {sum(timings) / len(timings) * 1e6:.1f} us, "
+          f"p50 {timings[len(timings) // 2] * 1e6:.1f} us, p99 {timings[int(len(timings) * 0.99)] * 1e6:.1f} us")
+
+    # A full linear scan is far too slow to run over every ping, so time a few
+    sample = pings[:2]
+    start = time.perf_counter()
+    for ping in sample:
+        linear = [f for f in fences if geodesic(ping, (f["center_lat"], f["center_long"])).meters <= f["radius_meters"]]
+        assert sorted(f["id"] for f in linear) == sorted(f["id"] for f in index.within(ping))
+    print(f"Linear scan per-ping latency: {(time.perf_counter() - start) / len(sample) * 1000:.1f} ms")
+
+    # Bulk ingest: every ping against every fence in vectorized haversine passes
+    start = time.perf_counter()
+    bulk = index.query_many(pings)
+    elapsed = time.perf_counter() - start
+    print(f"Bulk query of {n_pings} pings: {elapsed * 1000:.1f} ms ({elapsed / n_pings * 1e6:.1f} us per ping)")
+    for ping, matches in zip(pings[:200], bulk):
+        assert sorted(g["id"] for g, _ in matches) == sorted(g["id"] for g in index.within(ping))
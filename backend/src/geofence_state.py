@@ -0,0 +1,240 @@
+import threading, time
+from collections import deque
+from src.geofence_index import haversine_meters, HAVERSINE_TOLERANCE
+from src.utils.logger import logging
+
+PENDING = "pending"
+INSIDE = "inside"
+
+class GeofenceStateTracker:
+    '''
+    Keeps the inside/outside status of every (user, geofence) pair in memory and emits enter/exit transitions.
+
+    - A user enters a fence once they have been within its radius for at least `min_dwell_seconds`.
+    - A user exits a fence only once they are more than `hysteresis_meters` outside its radius,
+      so GPS jitter around a boundary does not produce enter/exit storms.
+    Transitions are queued and written to `geofence_alerts` in batches by a background thread,
+    keeping the database off the per-ping path.
+
+    A failed batch is set aside and retried with backoff, so it never blocks later transitions. If it has
+    failed `max_attempts` times while other writes succeeded, it holds a bad row (e.g. a constraint error):
+    it is split in half to isolate it, and a single row that still fails is dead-lettered and logged. During
+    an outage batches keep retrying instead. At most `max_pending` transitions wait, queued or retrying;
+    beyond that the oldest are dropped. Drops and dead letters are counted for stats().
+    '''
+    def __init__(self, client, hysteresis_meters=25.0, min_dwell_seconds=0.0, flush_interval=2.0, batch_size=500, max_pending=100000, max_attempts=5):
+        self.client = client
+        self.hysteresis_meters = hysteresis_meters
+        self.min_dwell_seconds = min_dwell_seconds
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        # user_id -> {geofence_id: [status, since]}
+        self.states = {}
+        self._pending = deque(maxlen=max_pending)
+        # Failed batches waiting for a retry: [batch, attempts, next_attempt_at, successful writes when it first failed]
+        self._retries = []
+        self._successes = 0
+        self.written = 0
+        self.dropped = 0
+        self.dead_lettered = 0
+        self._flusher = None
+        self._stop = threading.Event()
+
+    def update(self, user_id, matches, timestamp=None):
+        '''
+        Advance the state machine of a user with the fences near their latest position.
+
+        matches: (geofence, distance_meters) pairs for every fence within radius + hysteresis_meters.
+        Returns the list of transitions emitted by this update.
+        '''
+        now = time.time() if timestamp is None else timestamp
+        user_states = self.states.get(user_id, {})
+        transitions = []
+        seen = set()
+
+        for geofence, distance in matches:
+            geofence_id = geofence["id"]
+            seen.add(geofence_id)
+            inside_radius = distance <= geofence["radius_meters"]
+            state = user_states.get(geofence_id)
+
+            if state is None:
+                if inside_radius:
+                    state = user_states[geofence_id] = [PENDING, now]
+                else:
+                    continue
+            if state[0] == PENDING:
+                if not inside_radius:
+                    # Left again before the minimum dwell elapsed
+                    del user_states[geofence_id]
+                elif now - state[1] >= self.min_dwell_seconds:
+                    state[0], state[1] = INSIDE, now
+                    transitions.append(self._transition(user_id, geofence_id, "enter", now))
+            # INSIDE stays inside as long as the fence is within radius + hysteresis
+
+        for geofence_id in [geofence_id for geofence_id in user_states if geofence_id not in seen]:
+            status = user_states.pop(geofence_id)[0]
+            if status == INSIDE:
+                transitions.append(self._transition(user_id, geofence_id, "exit", now))
+
+        if user_states:
+            self.states[user_id] = user_states
+        else:
+            self.states.pop(user_id, None)
+        return transitions
+
+    def _transition(self, user_id, geofence_id, event, timestamp):
+        if len(self._pending) >= self.max_pending:
+            # The deque drops its oldest entry on append
+            self.dropped += 1
+        self._pending.append({
+            "uid": user_id,
+            "geofence_id": geofence_id,
+            "message": f"{'Entered' if event == 'enter' else 'Exited'} geofence {geofence_id}",
+            "is_sent": event == "enter",
+        })
+        return {"geofence_id": geofence_id, "event": event, "timestamp": timestamp}
+
+    def _failed(self, batch, attempts, now, successes):
+        if attempts < self.max_attempts or self._successes == successes:
+            delay = self.flush_interval * (2 ** (min(attempts, self.max_attempts) - 1))
+            self._retries.append([batch, attempts, now + delay, successes])
+            logging.error(f"Failed to persist {len(batch)} geofence transitions (attempt {attempts}), retrying in {delay:.0f}s.")
+        elif len(batch) > 1:
+            # Fails while other writes succeed: split it so its good rows are written and bad rows isolated
+            middle = len(batch) // 2
+            self._retries.append([batch[:middle], 0, now, self._successes])
+            self._retries.append([batch[middle:], 0, now, self._successes])
+        else:
+            self.dead_lettered += 1
+            logging.error(f"Dropping geofence transition after {attempts} failed attempts: {batch[0]}")
+        # Rows waiting for a retry count against the same bound as the queue
+        while self._retries and sum(len(retry[0]) for retry in self._retries) + len(self._pending) > self.max_pending:
+            self.dropped += len(self._retries.pop(0)[0])
+
+    def flush(self):
+        '''
+        Write queued transitions to geofence_alerts in batches. Failed batches are retried on later flushes
+        with backoff, without holding back newer transitions.
+        '''
+        written = 0
+        now = time.time()
+        healthy = True
+        retries, self._retries = self._retries, []
+        for retry in retries:
+            batch, attempts, next_attempt_at, successes = retry
+            if not healthy or next_attempt_at > now:
+                self._retries.append(retry)
+            elif self.client.insert_geofence_alerts(batch) is None:
+                healthy = False
+                self._failed(batch, attempts + 1, now, successes)
+            else:
+                written += len(batch)
+                self._successes += 1
+        # New transitions are tried even when a retry failed, so a bad batch cannot hold them back
+        while self._pending:
+            batch = []
+            while self._pending and len(batch) < self.batch_size:
+                batch.append(self._pending.popleft())
+            if self.client.insert_geofence_alerts(batch) is None:
+                self._failed(batch, 1, now, self._successes)
+                break
+            written += len(batch)
+            self._successes += 1
+        self.written += written
+        return written
+
+    def stats(self):
+        return {
+            "pending": len(self._pending),
+            "retrying": sum(len(retry[0]) for retry in self._retries),
+            "written": self.written,
+            "dropped": self.dropped,
+            "dead_lettered": self.dead_lettered,
+        }
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def start(self):
+        if self._flusher is None:
+            self._stop.clear()
+            self._flusher = threading.Thread(target=self._run, name="geofence-state", daemon=True)
+            self._flusher.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=1)
+            self._flusher = None
+        self.flush()
+
+class MovementShortCircuit:
+    '''
+    Remembers each user's last evaluated position, its geofence matches and its clearance
+    (distance to the nearest fence boundary or grid cell edge). A ping that moved less than the
+    clearance cannot have crossed any boundary, so its matches are reused without a geofence scan.
+    Entries are tied to the geofence cache version and ignored once the geofences change.
+    '''
+    def __init__(self):
+        self.last = {}
+        self.skipped = 0
+        self.evaluated = 0
+
+    def lookup(self, user_id, location, version):
+        entry = self.last.get(user_id)
+        if entry is not None and entry[0] == version:
+            _, lat, lon, clearance, matches = entry
+            # Pad the spherical distance so the check stays conservative against the geodesic one
+            if haversine_meters(lat, lon, location[0], location[1]) * (1 + HAVERSINE_TOLERANCE) < clearance:
+                self.skipped += 1
+                return matches
+        return None
+
+    def store(self, user_id, location, version, clearance, matches):
+        self.evaluated += 1
+        self.last[user_id] = (version, location[0], location[1], clearance, matches)
+
+    def stats(self):
+        return {"evaluated": self.evaluated, "skipped": self.skipped}
+
+if __name__=="__main__":
+    # A table that rejects one bad row, then a database outage: later transitions must still be written,
+    # the bad row dead-lettered, and the queue stays bounded
+    class FakeClient:
+        def __init__(self):
+            self.rows, self.down = [], False
+        def insert_geofence_alerts(self, rows):
+            if self.down or any(row["uid"] == "bad" for row in rows):
+                return None
+            self.rows.extend(rows)
+            return rows
+
+    client = FakeClient()
+    tracker = GeofenceStateTracker(client, flush_interval=0.0, batch_size=8, max_pending=50, max_attempts=3)
+    near = ({"id": 1, "radius_meters": 10}, 0)
+    for user in ["a", "b", "bad", "c", "d"]:
+        tracker.update(user, [near])
+    tracker.flush()
+    for i in range(30):
+        tracker.update(f"later{i}", [near])
+        tracker.flush()
+    assert len(client.rows) == 34 and "bad" not in [row["uid"] for row in client.rows], client.rows
+    assert tracker.stats()["dead_lettered"] == 1 and tracker.stats()["retrying"] == 0
+
+    client.down = True
+    for i in range(200):
+        tracker.update(f"user{i}", [near])
+        tracker.flush()
+    stats = tracker.stats()
+    assert stats["pending"] + stats["retrying"] <= 50 and stats["dropped"] > 0, stats
+    client.down = False
+    for _ in range(20):
+        tracker.flush()
+    stats = tracker.stats()
+    assert stats["pending"] == stats["retrying"] == 0
+    assert len(client.rows) == 34 + 200 - stats["dropped"], (len(client.rows), stats)
+    print(stats)
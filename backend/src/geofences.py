@@ -1,21 +1,31 @@
 from geopy.distance import geodesic
-from src.database.supabase_config import Supabase
-from opencage.geocoder import OpenCageGeocode
+from src.clients import supabase
+from src.geofence_cache import GeofenceCache
+from src.geofence_state import GeofenceStateTracker, MovementShortCircuit
+from src.services.opencage_config import OpenCage
 from dotenv import load_dotenv
-import os
+import os, time
 
 load_dotenv()
-supabase=Supabase()
+geofence_state=GeofenceStateTracker(
+    supabase,
+    hysteresis_meters=float(os.getenv("GEOFENCE_HYSTERESIS_METERS", "25")),
+    min_dwell_seconds=float(os.getenv("GEOFENCE_MIN_DWELL_SECONDS", "0")),
+    max_pending=int(os.getenv("GEOFENCE_ALERT_MAX_PENDING", "100000")),
+)
+# The index is padded by the hysteresis band so exits can be detected from the candidate fences alone
+geofence_cache=GeofenceCache(
+    supabase,
+    refresh_interval=float(os.getenv("GEOFENCE_REFRESH_SECONDS", "30")),
+    padding_meters=geofence_state.hysteresis_meters,
+)
+movement_filter=MovementShortCircuit()
+opencage=OpenCage()
 
-def get_lat_long_opencage(location):
-    api_key=os.getenv("OPEN_CAGE_API")
-    geocoder = OpenCageGeocode(api_key)
-    result = geocoder.geocode(location)
-    if result:
-        loc={
-            "center_lat":result[0]['geometry']['lat'],
-            "center_long":result[0]['geometry']['lng']
-        }
+async def get_lat_long_opencage(location):
+    # Served from the normalized memory/SQLite geocode cache when possible
+    loc = await opencage.geocode(location)
+    if loc:
         return loc
     else:
         print("Location not found.")
@@ -28,19 +38,52 @@ def is_within_geofence(user_location, geofence_center, radius):
     # Return whether the user is within the geofence
     return distance <= radius
 
-def has_alert_been_sent(user_id, geofence_id):
-    # Check in the database if the alert has been sent
-    alert = supabase.get_geofence_alerts(user_id, geofence_id)
-    if len(alert)==0:
-        alert=None
-    return alert is not None and alert[0]["is_sent"]
+def track_location(user_id, user_location, timestamp=None):
+    '''
+    Matches a location ping against the geofence cache and advances the user's enter/exit state.
+    Returns the geofences containing the location and the transitions emitted by this ping.
+    '''
+    # Read the version first so a concurrent geofence change invalidates what is stored below
+    version = geofence_cache.version
+    matches = movement_filter.lookup(user_id, user_location, version)
+    if matches is None:
+        matches, clearance = geofence_cache.query_with_clearance(user_location, geofence_state.hysteresis_meters)
+        movement_filter.store(user_id, user_location, version, clearance, matches)
+    transitions = geofence_state.update(user_id, matches, timestamp)
+    inside = [geofence for geofence, distance in matches if distance <= geofence["radius_meters"]]
+    return inside, transitions
 
-def mark_alert_as_sent(user_id, geofence_id):
-    # Insert a new record in UserAlert
-    new_alert={
-        "uid":user_id,
-        "geofence_id":geofence_id,
-        "message":f"Alert for geofence {geofence_id}",
-        "is_sent":True
-    }
-    return supabase.insert_geofence_alerts(new_alert)
+def match_pings(pings):
+    '''
+    CPU-heavy half of track_locations: sorts the pings by time (pings without a timestamp get the current
+    time) and matches them all against the geofences in one vectorized pass. Touches no per-user state,
+    so it can run in a worker thread. Returns the sorted pings and their matches.
+    '''
+    now = time.time()
+    pings = [{**ping, "timestamp": ping.get("timestamp") or now} for ping in pings]
+    # Stable sort keeps the upload order for pings with equal timestamps
+    pings.sort(key=lambda ping: ping["timestamp"])
+    all_matches = geofence_cache.query_many([(ping["latitude"], ping["longitude"]) for ping in pings], geofence_state.hysteresis_meters)
+    return pings, all_matches
+
+def replay_pings(pings, all_matches):
+    '''
+    Replays matched pings through the state tracker in time order per user. Runs where track_location
+    runs (the event loop), so the tracker's state is only ever touched from one thread.
+    '''
+    alerts = {}
+    transitions = {}
+    for ping, matches in zip(pings, all_matches):
+        user_id = ping["user_id"]
+        transitions.setdefault(user_id, []).extend(geofence_state.update(user_id, matches, ping["timestamp"]))
+        alerts[user_id] = [geofence for geofence, distance in matches if distance <= geofence["radius_meters"]]
+    return alerts, transitions
+
+def track_locations(pings):
+    '''
+    Bulk version of track_location for buffered or aggregated pings.
+    pings: dicts with user_id, latitude, longitude and an optional timestamp (epoch seconds).
+    All pings are matched in one vectorized pass, then replayed through the state tracker in time order per user.
+    Returns {user_id: geofences containing the user's latest ping} and {user_id: transitions}.
+    '''
+    return replay_pings(*match_pings(pings))
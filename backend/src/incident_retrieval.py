@@ -0,0 +1,88 @@
+import asyncio, json
+from src.utils.logger import logging
+
+async def iter_incident_hashes(db, cursor=None, page_size=500):
+    '''
+    Yields incident_reporting rows in id order, fetching one page at a time after the cursor id.
+    '''
+    after_id = cursor
+    while True:
+        response = await db.retrieve_hash_page(after_id, page_size)
+        if response is None:
+            raise RuntimeError("Failed to fetch incident hashes from supabase")
+        page = response.data
+        if not page:
+            return
+        for row in page:
+            yield row
+        if len(page) < page_size:
+            return
+        after_id = page[-1]["id"]
+
+async def fetch_incident(pinata, record, timeout):
+    '''
+    Fetch one incident from IPFS. Failures are reported in the record instead of aborting the stream.
+    '''
+    ipfs_hash = record["hash"]
+    try:
+        response = await asyncio.wait_for(pinata.get_data_from_ipfs(ipfs_hash), timeout)
+        if response.status_code == 200:
+            return {"id": record["id"], "ipfs_hash": ipfs_hash, "data": response.json()}
+        return {
+            "id": record["id"],
+            "ipfs_hash": ipfs_hash,
+            "data": "Failed to retrieve data",
+            "status_code": response.status_code,
+            "error": response.text
+        }
+    except asyncio.TimeoutError:
+        return {"id": record["id"], "ipfs_hash": ipfs_hash, "data": "Failed to retrieve data", "error": "Timed out"}
+    except Exception as e:
+        logging.error(f"Failed to fetch incident {ipfs_hash} from IPFS: {e}")
+        return {"id": record["id"], "ipfs_hash": ipfs_hash, "data": "Failed to retrieve data", "error": str(e)}
+
+async def stream_incidents(db, pinata, cursor=None, limit=None, page_size=500, concurrency=32, timeout=10.0):
+    '''
+    Streams incidents as NDJSON lines in completion order.
+
+    Up to `concurrency` IPFS fetches run at once across page boundaries, each bounded by `timeout` seconds.
+    The last line is {"next_cursor": id} to resume from when `limit` was reached (with an "error" key if
+    paging failed), or {"next_cursor": null} once every incident has been sent.
+    '''
+    rows = iter_incident_hashes(db, cursor, page_size)
+    pending = set()
+    started = 0
+    last_id = cursor
+    exhausted = False
+    error = None
+    try:
+        while True:
+            while not exhausted and len(pending) < concurrency and (limit is None or started < limit):
+                try:
+                    record = await rows.__anext__()
+                except StopAsyncIteration:
+                    exhausted = True
+                    break
+                except Exception as e:
+                    # Stop paging, finish what is in flight and let the client resume from the cursor
+                    error = str(e)
+                    exhausted = True
+                    break
+                pending.add(asyncio.create_task(fetch_incident(pinata, record, timeout)))
+                started += 1
+                last_id = record["id"]
+            if not pending:
+                break
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield json.dumps(task.result()) + "\n"
+        if error is not None:
+            yield json.dumps({"next_cursor": last_id, "error": error}) + "\n"
+        else:
+            more = not exhausted and limit is not None and started >= limit
+            yield json.dumps({"next_cursor": last_id if more else None}) + "\n"
+    finally:
+        # Client went away mid-stream
+        for task in pending:
+            task.cancel()
+        await rows.aclose()
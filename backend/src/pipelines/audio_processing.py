@@ -1,47 +1,118 @@
-import tensorflow
-import librosa
-import joblib
 import numpy as np
+import asyncio, os
+from src.pipelines.inference_scheduler import InferenceScheduler, InferenceBusy
+from src.pipelines.inference_pool import InferencePool, predict_in_worker
+from src.pipelines.inference_backends import load_backend
 
 class Audio_Processing:
-    def __init__(self):
-        self.model=joblib.load("./src/pipelines/Model.pkl")
+    def __init__(self, pool_workers=None, backend=None, model_path=None):
+        pool_workers = int(os.getenv("AUDIO_POOL_WORKERS", "2")) if pool_workers is None else pool_workers
+        # Model runtime: keras (full TensorFlow), tflite or onnx, see inference_backends
+        self.backend_name=backend or os.getenv("AUDIO_BACKEND", "keras")
+        self.model_path=model_path
+        self._backend=None
+        # With pool_workers > 0, streaming inference runs in worker processes that each hold the model;
+        # with 0 it runs on a thread of this process
+        self.pool=InferencePool(pool_workers, self.backend_name, model_path) if pool_workers > 0 else None
+        # Feature windows from all audio sessions are batched into shared predict() calls
+        self.scheduler=InferenceScheduler(
+            predict_in_worker if self.pool else self.predict_batch,
+            max_batch=int(os.getenv("AUDIO_MAX_BATCH", "32")),
+            max_wait_ms=float(os.getenv("AUDIO_MAX_WAIT_MS", "10")),
+            executor=self.pool.executor if self.pool else None,
+            max_inflight=pool_workers if self.pool else 1,
+            max_queue=int(os.getenv("AUDIO_MAX_PENDING", "256"))
+        )
+    
+    @property
+    def backend(self):
+        # Loaded on first in-process use; streaming inference in the pool does not need it here
+        if self._backend is None:
+            # The model runtime is only imported once a model is actually needed
+            self._backend=load_backend(self.backend_name, self.model_path)
+        return self._backend
     
     def preprocess_audio(self,file_path, max_pad_len=174):
+        import librosa
         try:
             # Load the audio file
             audio, sample_rate = librosa.load(file_path, sr=16000)
             
-            # Extract MFCC features
-            mfccs = librosa.feature.mfcc(y=audio, sr=sample_rate, n_mfcc=20)
-            
-            # Pad or truncate the MFCCs to ensure they have a consistent length
-            if mfccs.shape[1] > max_pad_len:
-                mfccs = mfccs[:, :max_pad_len]
-            else:
-                pad_width = max_pad_len - mfccs.shape[1]
-                mfccs = np.pad(mfccs, pad_width=((0, 0), (0, pad_width)), mode='constant')
-            
-            # Add an extra dimension to match the input shape of the model
-            mfccs = mfccs.reshape(1, 20, max_pad_len, 1)
-            
-            return mfccs
+            return self.preprocess_samples(audio, sample_rate, max_pad_len)
         except Exception as e:
             print(f"Error processing {file_path}: {e}")
             return None
     
+    def preprocess_samples(self,audio, sample_rate=16000, max_pad_len=174):
+        import librosa
+        # Extract MFCC features
+        mfccs = librosa.feature.mfcc(y=audio, sr=sample_rate, n_mfcc=20)
+        
+        # Pad or truncate the MFCCs to ensure they have a consistent length
+        if mfccs.shape[1] > max_pad_len:
+            mfccs = mfccs[:, :max_pad_len]
+        else:
+            pad_width = max_pad_len - mfccs.shape[1]
+            mfccs = np.pad(mfccs, pad_width=((0, 0), (0, pad_width)), mode='constant')
+        
+        # Add an extra dimension to match the input shape of the model
+        mfccs = mfccs.reshape(1, 20, max_pad_len, 1)
+        
+        return mfccs
+    
+    def classify(self,preprocessed_audio):
+        # Make predictions
+        prediction = self.backend.predict(preprocessed_audio)
+        return self.to_label(prediction[0])
+    
+    def to_label(self,prediction):
+        # Convert the prediction to a label
+        return 'Scream' if np.ravel(prediction)[0] > 0.7 else 'Non-Scream'
+    
+    def predict_batch(self,batch):
+        return self.backend.predict(batch)
+    
     def process_audio(self,audio_path):
         preprocessed_audio = self.preprocess_audio(audio_path)
 
-        # Make predictions
         if preprocessed_audio is not None:
-            prediction = self.model.predict(preprocessed_audio)
-            # Convert the prediction to a label
-            label = 'Scream' if prediction[0] > 0.7 else 'Non-Scream'
-            return label
+            return self.classify(preprocessed_audio)
         else:
             print("Error in preprocessing the audio file.")
+    
+    async def process_features_async(self,mfccs):
+        '''
+        Classify a ready (1, 20, 174, 1) MFCC matrix, e.g. from StreamingMFCC. This is the entry point for
+        streamed audio: the prediction runs in a batch shared with the other audio sessions.
+        Raises InferenceBusy when too many windows are already waiting for inference.
+        '''
+        try:
+            return self.to_label(await self.scheduler.infer(mfccs))
+        except InferenceBusy:
+            raise
+        except Exception as e:
+            print(f"Error processing audio features: {e}")
+            return None
+
+    async def warm_up(self):
+        '''
+        Import librosa, load the model and run one dummy inference (in every pool worker when there is a pool),
+        so the first audio session does not pay for any of it.
+        '''
+        from src.pipelines.streaming_features import StreamingMFCC
+        await asyncio.to_thread(StreamingMFCC)
+        dummy = np.zeros((1, 20, 174, 1), dtype=np.float32)
+        if self.pool:
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*[loop.run_in_executor(self.pool.executor, predict_in_worker, dummy) for _ in range(self.pool.workers)])
+        else:
+            await asyncio.to_thread(self.predict_batch, dummy)
+
+    async def shutdown(self):
+        await self.scheduler.stop()
+        if self.pool:
+            self.pool.shutdown()
 
 if __name__=="__main__":
-    audio_processing = Audio_Processing()
+    audio_processing = Audio_Processing(pool_workers=0)
     audio_processing.process_audio("../test-scream.wav")
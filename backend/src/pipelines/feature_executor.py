@@ -0,0 +1,48 @@
+import asyncio, os
+from concurrent.futures import ThreadPoolExecutor
+from src.pipelines.inference_scheduler import InferenceBusy
+
+class FeatureExecutor:
+    '''
+    Dedicated, bounded thread pool for decoding audio chunks and extracting their MFCC features.
+
+    Keeps feature work out of the default executor, which also serves notification sends and route
+    computation, so neither can starve the other. At most `max_workers` chunks are processed at once and
+    at most `max_pending` may be queued or running; beyond that run() raises InferenceBusy, like a full
+    inference queue, and the chunk is skipped.
+    '''
+    def __init__(self, max_workers=4, max_pending=64):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="audio-features")
+        # Only touched on the event loop
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    async def run(self, func, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise InferenceBusy(f"{self.max_pending} audio chunks already waiting for feature extraction")
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.pool, func, *args)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+
+    def stats(self):
+        return {
+            "max_workers": self.max_workers,
+            "pending": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False)
+
+feature_executor = FeatureExecutor(
+    max_workers=int(os.getenv("AUDIO_FEATURE_WORKERS", "4")),
+    max_pending=int(os.getenv("AUDIO_FEATURE_MAX_PENDING", "64")),
+)
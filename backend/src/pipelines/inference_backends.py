@@ -0,0 +1,162 @@
+import os
+import numpy as np
+
+# Default model file of each backend; AUDIO_MODEL_PATH overrides it
+MODEL_PATHS = {
+    "keras": "./src/pipelines/Model.pkl",
+    "tflite": "./src/pipelines/Model.tflite",
+    "onnx": "./src/pipelines/Model.onnx",
+}
+
+class KerasBackend:
+    '''
+    The pickled Keras model, served by full TensorFlow.
+    '''
+    name = "keras"
+
+    def __init__(self, model_path):
+        import tensorflow
+        import joblib
+        self.model = joblib.load(model_path)
+
+    def predict(self, batch):
+        return np.asarray(self.model.predict(batch, verbose=0))
+
+class TFLiteBackend:
+    '''
+    The model exported with export_tflite, served by the TFLite interpreter. Uses the small
+    tflite_runtime package when installed, otherwise the interpreter bundled with TensorFlow.
+    '''
+    name = "tflite"
+
+    def __init__(self, model_path):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+        self.interpreter = Interpreter(model_path=model_path)
+        self.interpreter.allocate_tensors()
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self.batch_size = int(self.input["shape"][0])
+
+    def predict(self, batch):
+        batch = np.asarray(batch, dtype=self.input["dtype"])
+        # The interpreter has a fixed input shape; reallocate only when the batch size changes
+        if len(batch) != self.batch_size:
+            self.interpreter.resize_tensor_input(self.input["index"], batch.shape)
+            self.interpreter.allocate_tensors()
+            self.batch_size = len(batch)
+        self.interpreter.set_tensor(self.input["index"], batch)
+        self.interpreter.invoke()
+        return np.array(self.interpreter.get_tensor(self.output["index"]))
+
+class ONNXBackend:
+    '''
+    The model exported with export_onnx, served by ONNX Runtime on the CPU.
+    '''
+    name = "onnx"
+
+    def __init__(self, model_path):
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        # With several pool workers, set this so the workers do not all claim every core (0: ONNX Runtime decides)
+        options.intra_op_num_threads = int(os.getenv("AUDIO_BACKEND_THREADS", "0"))
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, batch):
+        return self.session.run(None, {self.input_name: np.asarray(batch, dtype=np.float32)})[0]
+
+BACKENDS = {backend.name: backend for backend in (KerasBackend, TFLiteBackend, ONNXBackend)}
+
+def load_backend(name=None, model_path=None):
+    '''
+    Load the scream model with the backend named by `name` (env AUDIO_BACKEND, default keras), from
+    `model_path` (env AUDIO_MODEL_PATH, default that backend's file in MODEL_PATHS).
+    '''
+    name = name or os.getenv("AUDIO_BACKEND", "keras")
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown audio backend {name!r}, expected one of {sorted(BACKENDS)}")
+    return BACKENDS[name](model_path or os.getenv("AUDIO_MODEL_PATH") or MODEL_PATHS[name])
+
+def export_tflite(model, path=MODEL_PATHS["tflite"]):
+    '''
+    Convert the Keras model to a TFLite flatbuffer (float32, no quantization, so predictions match).
+    '''
+    import tensorflow as tf
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    with open(path, "wb") as f:
+        f.write(converter.convert())
+    return path
+
+def export_onnx(model, path=MODEL_PATHS["onnx"]):
+    '''
+    Convert the Keras model to ONNX with a dynamic batch dimension.
+    '''
+    import tensorflow as tf
+    import tf2onnx
+    spec = (tf.TensorSpec((None, *model.input_shape[1:]), tf.float32, name="mfcc"),)
+    tf2onnx.convert.from_keras(model, input_signature=spec, output_path=path)
+    return path
+
+if __name__=="__main__":
+    # Export:    python -m src.pipelines.inference_backends export
+    # Benchmark: python -m src.pipelines.inference_backends [backend ...]
+    # Each backend is measured in a fresh process, so load time and memory include its imports.
+    import json, subprocess, sys, time
+
+    FEATURES = (1, 20, 174, 1)
+
+    def measure(name):
+        import resource
+        start = time.perf_counter()
+        backend = load_backend(name)
+        load_ms = (time.perf_counter() - start) * 1000
+        rng = np.random.default_rng(0)
+        # MFCC-like inputs; the same seed gives every backend the same inputs for the parity check
+        inputs = rng.normal(0, 50, (64, *FEATURES[1:])).astype(np.float32)
+        backend.predict(inputs[:1])
+        latencies = []
+        for row in inputs:
+            start = time.perf_counter()
+            backend.predict(row[None])
+            latencies.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        outputs = np.concatenate([backend.predict(inputs[i:i + 32]) for i in range(0, len(inputs), 32)])
+        batch_ms = (time.perf_counter() - start) * 1000 / (len(inputs) / 32)
+        latencies.sort()
+        return {
+            "load_ms": load_ms,
+            "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "p50_ms": latencies[len(latencies) // 2],
+            "p99_ms": latencies[int(len(latencies) * 0.99)],
+            "batch32_ms": batch_ms,
+            "outputs": np.ravel(outputs[:, 0]).tolist(),
+        }
+
+    if sys.argv[1:2] == ["measure"]:
+        print(json.dumps(measure(sys.argv[2])))
+    elif sys.argv[1:2] == ["export"]:
+        keras = KerasBackend(MODEL_PATHS["keras"])
+        print(export_tflite(keras.model))
+        print(export_onnx(keras.model))
+    else:
+        results = {}
+        for name in sys.argv[1:] or list(BACKENDS):
+            run = subprocess.run([sys.executable, "-m", "src.pipelines.inference_backends", "measure", name], capture_output=True, text=True)
+            if run.returncode != 0:
+                print(f"{name:<7} failed: {run.stderr.strip().splitlines()[-1] if run.stderr.strip() else run.returncode}")
+                continue
+            results[name] = json.loads(run.stdout.strip().splitlines()[-1])
+            r = results[name]
+            print(f"{name:<7} load {r['load_ms']:7.0f} ms, peak RSS {r['rss_mb']:6.0f} MB, batch 1 p50 {r['p50_ms']:6.2f} ms / p99 {r['p99_ms']:6.2f} ms, batch 32 {r['batch32_ms']:7.2f} ms")
+        # Parity against the Keras model: raw scores and the Scream / Non-Scream label at the 0.7 threshold
+        if "keras" in results:
+            reference = np.array(results["keras"]["outputs"])
+            for name, r in results.items():
+                if name == "keras":
+                    continue
+                outputs = np.array(r["outputs"])
+                agree = np.mean((outputs > 0.7) == (reference > 0.7))
+                print(f"{name:<7} vs keras: max abs diff {np.max(np.abs(outputs - reference)):.2e}, label agreement {agree:.1%}")
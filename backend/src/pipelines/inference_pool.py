@@ -0,0 +1,39 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# Model backend of the current worker process, loaded once by the pool initializer
+_backend = None
+
+def load_worker_backend(backend, model_path):
+    global _backend
+    from src.pipelines.inference_backends import load_backend
+    _backend = load_backend(backend, model_path)
+
+def predict_in_worker(batch):
+    '''
+    Runs in a pool process: predict a batch with the model loaded at process start.
+    '''
+    return _backend.predict(batch)
+
+class InferencePool:
+    '''
+    Pool of worker processes for model inference, so the model runtime never runs on the event loop's process.
+
+    Each worker loads the model once when it starts, with the backend chosen by `backend` (see
+    inference_backends.load_backend). Workers are spawned rather than forked, because forking a process
+    that already imported TensorFlow is unsafe. Pass `executor` and `predict_in_worker` to an
+    InferenceScheduler to run its batches here.
+    '''
+    def __init__(self, workers=2, backend=None, model_path=None):
+        self.workers = workers
+        self.backend = backend
+        self.model_path = model_path
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=load_worker_backend,
+            initargs=(backend, model_path)
+        )
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,163 @@
+import asyncio, time
+import numpy as np
+from src.utils.logger import logging
+
+class InferenceBusy(Exception):
+    '''
+    Raised by InferenceScheduler.infer when the queue of pending inputs is full, and by
+    FeatureExecutor.run when too many audio chunks are waiting for feature extraction.
+    '''
+
+class InferenceScheduler:
+    '''
+    Cross-session micro-batching for model inference.
+
+    Sessions await infer(features) with a (1, ...) input. The scheduler stacks the pending inputs of all
+    sessions into one batch, flushed when it holds `max_batch` inputs or `max_wait_ms` after its first
+    input arrived. It runs one `predict` per batch in `executor` (the default thread pool when None) and
+    resolves every caller with its own row of the output. Up to `max_inflight` batches run at once (one per
+    worker process when `executor` is an InferencePool's), so under load the next batch fills up while
+    the current ones run. At most `max_queue` inputs may wait; beyond that infer() raises InferenceBusy
+    instead of queueing more work.
+    '''
+    def __init__(self, predict, max_batch=32, max_wait_ms=10.0, executor=None, max_inflight=1, max_queue=256):
+        self.predict = predict
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.executor = executor
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self._queue = None
+        self._task = None
+        self._slots = None
+        self._running = set()
+        self.batches = 0
+        self.requests = 0
+        self.rejected = 0
+        self.largest_batch = 0
+
+    async def infer(self, features):
+        '''
+        Prediction row for one input, computed as part of a batch.
+        '''
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue(self.max_queue)
+            self._slots = asyncio.Semaphore(self.max_inflight)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((features, future))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise InferenceBusy(f"{self.max_queue} inputs already waiting for inference")
+        return await future
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            # Take whatever is already queued without waiting
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            remaining = deadline - time.monotonic()
+            if len(batch) >= self.max_batch or remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            # Only start collecting once a batch can run, so inputs keep accumulating meanwhile
+            await self._slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+            # Callers that went away (closed websocket) do not need a prediction
+            batch = [(features, future) for features, future in batch if not future.done()]
+            if not batch:
+                self._slots.release()
+                continue
+            task = asyncio.get_running_loop().create_task(self._execute(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _execute(self, batch):
+        try:
+            inputs = np.concatenate([features for features, _ in batch])
+            outputs = await asyncio.get_running_loop().run_in_executor(self.executor, self.predict, inputs)
+        except Exception as e:
+            logging.error(f"Batch inference of {len(batch)} inputs failed: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._slots.release()
+        self.batches += 1
+        self.requests += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        for (_, future), output in zip(batch, outputs):
+            if not future.done():
+                future.set_result(output)
+
+    async def stop(self):
+        tasks = list(self._running)
+        if self._task is not None:
+            tasks.append(self._task)
+            self._task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "mean_batch": self.requests / self.batches if self.batches else None,
+            "largest_batch": self.largest_batch,
+            "rejected": self.rejected,
+            "inflight": len(self._running),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+        }
+
+if __name__=="__main__":
+    # Fake model: a fixed per-call overhead plus a small per-input cost, like a framework predict()
+    CALL_MS, ITEM_MS = 3.0, 0.05
+    HOP_S, DURATION_S = 0.5, 4.0
+
+    def predict(inputs):
+        time.sleep((CALL_MS + ITEM_MS * len(inputs)) / 1000)
+        return np.full((len(inputs), 1), 0.1, dtype=np.float32)
+
+    async def simulate(streams, max_batch):
+        scheduler = InferenceScheduler(predict, max_batch=max_batch, max_wait_ms=10, max_queue=streams)
+        features = np.zeros((1, 20, 174, 1), dtype=np.float32)
+        latencies = []
+
+        async def session(offset):
+            await asyncio.sleep(offset)
+            end = time.perf_counter() + DURATION_S
+            while time.perf_counter() < end:
+                start = time.perf_counter()
+                await scheduler.infer(features)
+                latencies.append((time.perf_counter() - start) * 1000)
+                await asyncio.sleep(max(0.0, HOP_S - (time.perf_counter() - start)))
+
+        start = time.perf_counter()
+        await asyncio.gather(*[session(i * HOP_S / streams) for i in range(streams)])
+        elapsed = time.perf_counter() - start
+        await scheduler.stop()
+        latencies.sort()
+        stats = scheduler.stats()
+        return len(latencies) / elapsed, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)], stats["mean_batch"]
+
+    print(f"Fake model: {CALL_MS} ms per call + {ITEM_MS} ms per input; each stream asks for a prediction every {HOP_S * 1000:.0f} ms")
+    for streams in (1, 10, 50, 100, 250, 500):
+        for max_batch in (1, 64):
+            throughput, p50, p99, mean_batch = asyncio.run(simulate(streams, max_batch))
+            print(f"{streams:4d} streams, max_batch {max_batch:3d}: {throughput:7.1f} predictions/s, p50 {p50:8.1f} ms, p99 {p99:8.1f} ms, mean batch {mean_batch:5.1f}")
@@ -0,0 +1,185 @@
+import io, struct
+import numpy as np
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# Assumed format of streams that never send a RIFF header
+DEFAULT_FORMAT = {"tag": WAVE_FORMAT_PCM, "channels": 1, "sample_rate": 16000, "bits": 16}
+
+def parse_wav_header(data):
+    '''
+    Parse the RIFF/WAVE header at the start of `data`.
+    Returns (format dict, offset of the first sample byte), or None if `data` does not start with a WAV header.
+    '''
+    if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        return None
+    pos = 12
+    fmt = None
+    while pos + 8 <= len(data):
+        chunk_id = data[pos:pos + 4]
+        size = struct.unpack("<I", data[pos + 4:pos + 8])[0]
+        body = pos + 8
+        if chunk_id == b"fmt " and body + 16 <= len(data):
+            tag, channels, sample_rate, _, _, bits = struct.unpack("<HHIIHH", data[body:body + 16])
+            if tag == WAVE_FORMAT_EXTENSIBLE and body + 26 <= len(data):
+                # The real format tag is the first two bytes of the sub-format GUID
+                tag = struct.unpack("<H", data[body + 24:body + 26])[0]
+            fmt = {"tag": tag, "channels": channels, "sample_rate": sample_rate, "bits": bits}
+        elif chunk_id == b"data":
+            return fmt, body
+        pos = body + size + (size & 1)
+    return None
+
+def decode_pcm(data, fmt):
+    '''
+    Decode whole frames of interleaved PCM to mono float32 in [-1, 1].
+    '''
+    bits, tag = fmt["bits"], fmt["tag"]
+    if tag == WAVE_FORMAT_IEEE_FLOAT and bits == 32:
+        samples = np.frombuffer(data, dtype="<f4")
+    elif tag == WAVE_FORMAT_PCM and bits == 16:
+        samples = np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768.0
+    elif tag == WAVE_FORMAT_PCM and bits == 32:
+        samples = np.frombuffer(data, dtype="<i4").astype(np.float32) / 2147483648.0
+    elif tag == WAVE_FORMAT_PCM and bits == 8:
+        samples = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    else:
+        raise ValueError(f"Unsupported WAV format {fmt}")
+    if fmt["channels"] > 1:
+        samples = samples.reshape(-1, fmt["channels"]).mean(axis=1)
+    return samples.astype(np.float32, copy=False)
+
+class AudioStream:
+    '''
+    Per-session audio buffer for /ws/audio-stream.
+
+    Incoming chunks are decoded in memory (a chunk starting with a RIFF header sets the stream format,
+    anything else is sample data in the current format, PCM16 mono 16 kHz by default), resampled to
+    `sample_rate` and written into a fixed buffer holding the latest `window_seconds` of audio. Every
+    `hop_seconds` of new audio, feed() returns the latest window for classification. Only the newest
+    window is classified however large the chunk, so the cost per chunk does not depend on session length.
+
+    With `extractor` (a StreamingMFCC), MFCC frames are computed as samples arrive and features() returns
+    the model input for the latest window without recomputing it from the samples.
+
+    With `gate` (an EnergyGate), windows that cannot contain a scream (silence, background hiss) are
+    not returned and skip feature extraction as well as inference: samples are only buffered raw, and
+    the extractor catches up on them when a window passes. After a long gap it restarts from the buffer,
+    which then also holds n_fft + 2 * hop_length samples before the window, so the features are the same
+    as with continuous extraction.
+    '''
+    def __init__(self, sample_rate=16000, window_seconds=2.0, hop_seconds=0.5, extractor=None, gate=None):
+        self.sample_rate = sample_rate
+        self.window = int(window_seconds * sample_rate)
+        self.hop = int(hop_seconds * sample_rate)
+        self.extractor = extractor
+        self.gate = gate
+        # With deferred extraction, keep the samples the extractor needs to rebuild the window's frames
+        lookback = extractor.n_fft + 2 * extractor.hop_length if extractor is not None and gate is not None else 0
+        self.capacity = self.window + lookback
+        self.buffer = np.zeros(self.capacity, dtype=np.float32)
+        self.filled = 0
+        self.since_last = 0
+        self.total_samples = 0
+        self.format = dict(DEFAULT_FORMAT)
+        self._remainder = b""
+        # Samples of the stream already pushed to the extractor
+        self.extracted = 0
+
+    def decode(self, chunk):
+        header = parse_wav_header(chunk)
+        if header is not None:
+            fmt, offset = header
+            if fmt is None or fmt["tag"] not in (WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT):
+                # Compressed or unusual encodings: let libsndfile decode the chunk as a complete file
+                import soundfile
+                samples, sample_rate = soundfile.read(io.BytesIO(chunk), dtype="float32", always_2d=True)
+                self._remainder = b""
+                return self._resample(samples.mean(axis=1), sample_rate)
+            self.format = fmt
+            self._remainder = b""
+            chunk = chunk[offset:]
+
+        data = self._remainder + chunk
+        frame_bytes = self.format["channels"] * self.format["bits"] // 8
+        usable = len(data) - len(data) % frame_bytes
+        # A chunk may end mid-frame; the partial frame is kept for the next chunk
+        self._remainder = data[usable:]
+        return self._resample(decode_pcm(data[:usable], self.format), self.format["sample_rate"])
+
+    def _resample(self, samples, sample_rate):
+        if sample_rate == self.sample_rate or len(samples) == 0:
+            return samples
+        import librosa
+        return librosa.resample(samples, orig_sr=sample_rate, target_sr=self.sample_rate).astype(np.float32)
+
+    def push(self, samples):
+        n = len(samples)
+        if n >= self.capacity:
+            self.buffer[:] = samples[-self.capacity:]
+        elif n:
+            self.buffer[:-n] = self.buffer[n:]
+            self.buffer[-n:] = samples
+        self.filled = min(self.capacity, self.filled + n)
+        self.since_last += n
+        self.total_samples += n
+        if self.gate is None:
+            self._extract()
+
+    def _extract(self):
+        # Bring the extractor up to date with the buffered samples
+        missing = self.total_samples - self.extracted
+        if self.extractor is None or missing == 0:
+            return
+        if missing <= self.filled:
+            self.extractor.push(self.buffer[-missing:])
+        else:
+            self.extractor.restart(self.buffer[-self.filled:], self.total_samples - self.filled)
+        self.extracted = self.total_samples
+
+    def feed(self, chunk):
+        '''
+        Add a chunk of audio bytes. Returns the latest window (up to `window_seconds` of samples) when a
+        hop of new audio has arrived and the gate, if any, lets it through, else None.
+        '''
+        self.push(self.decode(chunk))
+        if self.since_last < self.hop:
+            return None
+        self.since_last = 0
+        window = self.buffer[-min(self.filled, self.window):]
+        if self.gate is not None:
+            if not self.gate.check(window):
+                return None
+            self._extract()
+        return window
+
+    def features(self):
+        '''
+        Model input for the latest window, from the incremental extractor.
+        '''
+        return self.extractor.features()
+
+if __name__=="__main__":
+    import time
+
+    # An hour of 16 kHz PCM16 audio streamed as 250 ms chunks: feed() cost stays flat over the session
+    chunk_samples = 4000
+    stream = AudioStream()
+    header = struct.pack("<4sI4s4sIHHIIHH4sI", b"RIFF", 0xFFFFFFFF, b"WAVE", b"fmt ", 16, 1, 1, 16000, 32000, 2, 16, b"data", 0xFFFFFFFF)
+    rng = np.random.default_rng(0)
+    pcm = (rng.standard_normal(chunk_samples) * 3000).astype("<i2").tobytes()
+    stream.feed(header)
+
+    chunks = 3600 * 16000 // chunk_samples
+    timings = []
+    windows = 0
+    for i in range(chunks):
+        start = time.perf_counter()
+        windows += stream.feed(pcm) is not None
+        timings.append(time.perf_counter() - start)
+    first = sum(timings[:1000]) / 1000 * 1e6
+    last = sum(timings[-1000:]) / 1000 * 1e6
+    print(f"{chunks} chunks ({stream.total_samples / 16000 / 60:.0f} min), {windows} windows classified")
+    print(f"feed(): first 1000 chunks {first:.1f} us/chunk, last 1000 chunks {last:.1f} us/chunk, buffer {stream.buffer.nbytes // 1024} KiB")
@@ -0,0 +1,155 @@
+import numpy as np
+
+class StreamingMFCC:
+    '''
+    Incremental MFCC extractor matching librosa.feature.mfcc(y, sr=16000, n_mfcc=20) with librosa's defaults:
+    n_fft=2048, hop_length=512, periodic Hann window, center=True with zero padding, 128 Slaney mel bands,
+    power_to_db(ref=1.0, amin=1e-10, top_db=80) and an orthonormal DCT-II.
+
+    push() computes STFT, mel and MFCC frames only for samples that have not been seen before. The latest
+    `window_frames` frames are kept in rolling matrices. features() returns them as the (1, 20, max_pad_len, 1)
+    model input, zero padded on the right like Audio_Processing.preprocess_samples.
+
+    Tolerance against librosa.feature.mfcc over the same window of samples:
+    - Interior frames match to float32 rounding (max abs difference below 1e-3, about 1e-4 typically).
+    - Edge frames differ. librosa zero pads the window's own edges, so its first and last
+      n_fft / (2 * hop_length) = 2 frames see silence. Here the first frames see the real audio before the
+      window. Frames also only exist once all of their samples have arrived, so the newest 2 frames lag.
+    - The top_db floor is taken over the frames held here instead of over librosa's frames. It only differs
+      when a bin falls more than 80 dB below a peak that one side sees and the other does not.
+    '''
+    def __init__(self, sample_rate=16000, n_mfcc=20, n_fft=2048, hop_length=512, n_mels=128, top_db=80.0, amin=1e-10, window_frames=174, max_pad_len=174):
+        import librosa
+
+        self.n_mfcc = n_mfcc
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.top_db = top_db
+        self.amin = amin
+        self.window_frames = min(window_frames, max_pad_len)
+        self.max_pad_len = max_pad_len
+        self.mel_basis = librosa.filters.mel(sr=sample_rate, n_fft=n_fft, n_mels=n_mels)
+        # Periodic Hann window, as scipy.signal.get_window("hann", n_fft) used by librosa
+        self.window = (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(n_fft) / n_fft)).astype(np.float32)
+        # First n_mfcc rows of the orthonormal DCT-II matrix over the mel axis
+        k = np.arange(n_mfcc)[:, None]
+        n = np.arange(n_mels)[None, :]
+        dct = np.cos(np.pi * k * (2 * n + 1) / (2 * n_mels)) * np.sqrt(2.0 / n_mels)
+        dct[0] /= np.sqrt(2.0)
+        self.dct = dct.astype(np.float32)
+
+        # center=True: frame t is centered on sample t * hop_length, with zeros before the stream starts
+        self.pending = np.zeros(n_fft // 2, dtype=np.float32)
+        self.mel_db = np.zeros((n_mels, self.window_frames), dtype=np.float32)
+        self.mfcc = np.zeros((n_mfcc, self.window_frames), dtype=np.float32)
+        self.count = 0
+        self.total_frames = 0
+
+    def push(self, samples):
+        '''
+        Add new samples and compute the frames they complete. Returns the number of new frames.
+        '''
+        self.pending = np.concatenate([self.pending, np.asarray(samples, dtype=np.float32)])
+        if len(self.pending) < self.n_fft:
+            return 0
+        n_new = (len(self.pending) - self.n_fft) // self.hop_length + 1
+        frames = np.lib.stride_tricks.sliding_window_view(self.pending, self.n_fft)[::self.hop_length][:n_new]
+        self.pending = self.pending[n_new * self.hop_length:]
+
+        # Only the frames that still fit in the rolling window are worth computing
+        keep = min(n_new, self.window_frames)
+        frames = frames[-keep:]
+        power = np.abs(np.fft.rfft(frames * self.window, axis=1)).astype(np.float32) ** 2
+        mel_db = 10.0 * np.log10(np.maximum(self.amin, self.mel_basis @ power.T))
+        self._append(self.mel_db, mel_db)
+        self._append(self.mfcc, self.dct @ mel_db)
+        self.count = min(self.window_frames, self.count + keep)
+        self.total_frames += n_new
+        return n_new
+
+    def restart(self, samples, position):
+        '''
+        Drop all state and continue from `samples`, which start at sample `position` of the stream, e.g.
+        after the stream skipped extraction for a while. Frames stay on the stream's frame grid, so once
+        `samples` cover the window plus n_fft + 2 * hop_length, the frames held are the same as if every
+        sample had been pushed. Returns the number of new frames.
+        '''
+        half = self.n_fft // 2
+        # First frame whose samples (centered on first * hop_length) all lie in `samples`
+        first = max(0, -(-(position + half) // self.hop_length))
+        offset = first * self.hop_length - half - position
+        if offset < 0:
+            # Only at the start of the stream: the frame window reaches into the zero padding before sample 0
+            samples = np.concatenate([np.zeros(-offset, dtype=np.float32), samples])
+            offset = 0
+        self.pending = np.asarray(samples[offset:], dtype=np.float32)
+        self.mel_db[:] = 0
+        self.mfcc[:] = 0
+        self.count = 0
+        self.total_frames = first
+        return self.push(np.zeros(0, dtype=np.float32))
+
+    @staticmethod
+    def _append(matrix, columns):
+        k = columns.shape[1]
+        matrix[:, :-k] = matrix[:, k:]
+        matrix[:, -k:] = columns
+
+    def features(self):
+        '''
+        The latest frames as a (1, n_mfcc, max_pad_len, 1) model input.
+        '''
+        out = np.zeros((self.n_mfcc, self.max_pad_len), dtype=np.float32)
+        n = self.count
+        if n:
+            mel_db = self.mel_db[:, -n:]
+            mfcc = self.mfcc[:, -n:].copy()
+            # top_db floor: only frames with bins under it need their DCT recomputed
+            floor = mel_db.max() - self.top_db
+            clipped = (mel_db < floor).any(axis=0)
+            if clipped.any():
+                mfcc[:, clipped] = self.dct @ np.maximum(mel_db[:, clipped], floor)
+            out[:, :n] = mfcc
+        return out.reshape(1, self.n_mfcc, self.max_pad_len, 1)
+
+if __name__=="__main__":
+    import time, librosa
+
+    sr, hop = 16000, 512
+    rng = np.random.default_rng(0)
+    t = np.arange(sr * 60) / sr
+    # A minute of tone bursts over noise
+    audio = (0.3 * np.sin(2 * np.pi * 440 * t) * (np.sin(2 * np.pi * 0.5 * t) > 0) + 0.02 * rng.standard_normal(len(t))).astype(np.float32)
+
+    # Parity: interior frames of a 2 s window against librosa over the same samples
+    window_frames = 1 + 2 * sr // hop
+    extractor = StreamingMFCC(window_frames=window_frames)
+    end = 10 * sr
+    extractor.push(audio[:end])
+    streamed = extractor.features()[0, :, :window_frames, 0]
+    # The newest streamed frame is centered at (total_frames - 1) * hop; line librosa's frames up with it
+    last_center = (extractor.total_frames - 1) * hop
+    start = last_center - (window_frames - 1) * hop
+    reference = librosa.feature.mfcc(y=audio[start:last_center + 1], sr=sr, n_mfcc=20)
+    interior = slice(2, window_frames - 2)
+    error = np.abs(streamed[:, interior] - reference[:, interior]).max()
+    edge_error = np.abs(streamed - reference[:, :window_frames]).max()
+    print(f"Parity over {window_frames} frames: interior max abs error {error:.2e}, including edge frames {edge_error:.2e}")
+
+    # CPU time per second of audio: 250 ms chunks, model input built every 500 ms
+    chunk = sr // 4
+    extractor = StreamingMFCC(window_frames=window_frames)
+    start = time.process_time()
+    for i in range(0, len(audio), chunk):
+        extractor.push(audio[i:i + chunk])
+        if (i // chunk) % 2:
+            extractor.features()
+    incremental = (time.process_time() - start) / 60 * 1000
+
+    start = time.process_time()
+    for i in range(0, len(audio), chunk):
+        if (i // chunk) % 2:
+            window = audio[max(0, i + chunk - 2 * sr):i + chunk]
+            librosa.feature.mfcc(y=window, sr=sr, n_mfcc=20)
+    recompute = (time.process_time() - start) / 60 * 1000
+    print(f"CPU per second of audio: incremental {incremental:.2f} ms, librosa over the 2 s window {recompute:.2f} ms")
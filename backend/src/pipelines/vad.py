@@ -0,0 +1,167 @@
+import os, threading
+import numpy as np
+
+class EnergyGate:
+    '''
+    Cheap voice-activity gate run on raw samples before MFCC extraction and model inference.
+
+    The window is split into `frame_length`-sample frames. A frame is active when its RMS level is at
+    least `min_dbfs` and its zero-crossing rate is at most `max_zcr`: silence and room tone fail the
+    level test, and broadband hiss (fans, wind, ZCR near 0.5) fails the ZCR test, while screams and
+    speech are loud and harmonic. A window passes when it has at least `min_active_frames` active
+    frames. Passed and gated windows are counted for stats().
+    '''
+    def __init__(self, min_dbfs=-40.0, max_zcr=0.45, min_active_frames=3, frame_length=512, enabled=True):
+        self.min_dbfs = min_dbfs
+        self.max_zcr = max_zcr
+        self.min_active_frames = min_active_frames
+        self.frame_length = frame_length
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.passed = 0
+        self.gated = 0
+
+    def frame_stats(self, samples):
+        '''
+        RMS level (dBFS) and zero-crossing rate of each whole frame of `samples`.
+        '''
+        count = len(samples) // self.frame_length
+        frames = np.asarray(samples[:count * self.frame_length], dtype=np.float32).reshape(count, self.frame_length)
+        # Level and crossings are measured around each frame's mean, so a microphone DC offset neither
+        # inflates the level nor hides zero crossings (without materialising the centred frames)
+        mean = frames.sum(axis=1) / self.frame_length
+        power = np.einsum("ij,ij->i", frames, frames) / self.frame_length - mean * mean
+        dbfs = 10 * np.log10(np.maximum(power, 1e-20))
+        below = frames < mean[:, None]
+        crossings = np.add.reduce(below[:, 1:] ^ below[:, :-1], axis=1, dtype=np.int32)
+        return dbfs, crossings / (self.frame_length - 1)
+
+    def active_frames(self, samples):
+        dbfs, zcr = self.frame_stats(samples)
+        return int(np.count_nonzero((dbfs >= self.min_dbfs) & (zcr <= self.max_zcr)))
+
+    def check(self, samples):
+        '''
+        True if the window may contain a scream and should be classified, False if it can be skipped.
+        '''
+        ok = not self.enabled or self.active_frames(samples) >= self.min_active_frames
+        with self._lock:
+            if ok:
+                self.passed += 1
+            else:
+                self.gated += 1
+        return ok
+
+    def stats(self):
+        total = self.passed + self.gated
+        return {
+            "enabled": self.enabled,
+            "inferred": self.passed,
+            "gated": self.gated,
+            "gated_ratio": self.gated / total if total else None,
+            "min_dbfs": self.min_dbfs,
+            "max_zcr": self.max_zcr,
+            "min_active_frames": self.min_active_frames,
+        }
+
+energy_gate = EnergyGate(
+    min_dbfs=float(os.getenv("AUDIO_VAD_MIN_DBFS", "-40")),
+    max_zcr=float(os.getenv("AUDIO_VAD_MAX_ZCR", "0.45")),
+    min_active_frames=int(os.getenv("AUDIO_VAD_MIN_ACTIVE_FRAMES", "3")),
+    enabled=os.getenv("AUDIO_VAD", "1") != "0"
+)
+
+if __name__=="__main__":
+    import time
+    from src.pipelines.stream_classifier import AudioStream
+    from src.pipelines.streaming_features import StreamingMFCC
+
+    # Ten minutes of synthetic 16 kHz audio in 2 s segments: mostly room tone, some fan hiss, some
+    # speech-like and scream-like harmonic sounds. Streamed in 250 ms chunks, with and without the gate.
+    sr, segment = 16000, 2 * 16000
+    rng = np.random.default_rng(0)
+    t = np.arange(segment) / sr
+
+    def harmonic(f0, level):
+        f = f0 * (1 + 0.03 * np.sin(2 * np.pi * 5 * t))
+        phase = 2 * np.pi * np.cumsum(f) / sr
+        tone = sum(np.sin(k * phase) / k for k in range(1, 6))
+        return (level * tone / np.max(np.abs(tone)) + rng.normal(0, 0.003, segment)).astype(np.float32)
+
+    kinds = {
+        "room tone": lambda: rng.normal(0, 0.002, segment).astype(np.float32),
+        "fan hiss": lambda: rng.normal(0, 0.03, segment).astype(np.float32),
+        "speech": lambda: harmonic(180, 0.1),
+        "scream": lambda: harmonic(1200, 0.5),
+    }
+    plan = rng.choice(list(kinds), size=300, p=[0.75, 0.1, 0.1, 0.05])
+    audio = np.concatenate([kinds[kind]() for kind in plan])
+    labels = np.repeat(plan, segment)
+    pcm = (np.clip(audio, -1, 1) * 32767).astype("<i2").tobytes()
+    chunk_bytes = 4000 * 2
+
+    def per_call_ms(func, number=1000):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        return (time.perf_counter() - start) * 1000 / number
+
+    def run(gate):
+        stream = AudioStream(window_seconds=2.0, hop_seconds=0.5, extractor=StreamingMFCC(window_frames=63), gate=gate)
+        # Reference: the same audio with every frame extracted as it arrives
+        reference = AudioStream(window_seconds=2.0, hop_seconds=0.5, extractor=StreamingMFCC(window_frames=63))
+        classified, missed, max_error = 0, 0, 0.0
+        for i in range(0, len(pcm), chunk_bytes):
+            window = stream.feed(pcm[i:i + chunk_bytes])
+            reference.feed(pcm[i:i + chunk_bytes])
+            if window is not None:
+                classified += 1
+                # Deferred extraction must give the features continuous extraction gives
+                max_error = max(max_error, float(np.abs(stream.features() - reference.features()).max()))
+            # A window containing scream must never be gated
+            end = stream.total_samples
+            if gate is not None and stream.since_last == 0 and window is None and "scream" in labels[max(0, end - segment):end]:
+                missed += 1
+        return classified, missed, max_error
+
+    def stream_ms(gate, data):
+        stream = AudioStream(window_seconds=2.0, hop_seconds=0.5, extractor=StreamingMFCC(window_frames=63), gate=gate)
+        start = time.perf_counter()
+        for i in range(0, len(data), chunk_bytes):
+            if stream.feed(data[i:i + chunk_bytes]) is not None:
+                stream.features()
+        return (time.perf_counter() - start) * 1000
+
+    gate = EnergyGate()
+    classified_all, _, _ = run(None)
+    classified, missed, max_error = run(gate)
+    print(f"Segments: { {kind: int(np.sum(plan == kind)) for kind in kinds} }")
+    print(f"Windows sent to the model: {classified_all} without the gate, {classified} with it ({gate.stats()['gated_ratio']:.0%} gated); scream windows gated: {missed}")
+    print(f"Features of passing windows vs continuous extraction: max abs difference {max_error:.2e}")
+    assert missed == 0 and max_error < 1e-3
+
+    # Decode, gate and feature extraction for the whole stream: a minute of room tone, and the mixed ten minutes
+    silence = (rng.normal(0, 0.002, 60 * sr) * 32767).astype("<i2").tobytes()
+    for name, data in (("60 s room tone", silence), ("10 min mixed", pcm)):
+        print(f"{name}: {stream_ms(None, data):.1f} ms without the gate, {stream_ms(EnergyGate(), data):.1f} ms with it")
+
+    # Per window: what the gate costs, and what a gated window saves: extracting its hop of frames and
+    # assembling the features, plus a model forward pass
+    window = audio[:segment]
+    extractor = StreamingMFCC(window_frames=63)
+    extractor.push(window)
+    hop = window[:sr // 2]
+
+    def extract():
+        extractor.push(hop)
+        extractor.features()
+
+    print(f"Per window: gate {per_call_ms(lambda: gate.active_frames(window)) * 1000:.0f} us, MFCC extraction {per_call_ms(extract) * 1000:.0f} us")
+    try:
+        from src.pipelines.inference_backends import load_backend
+        backend = load_backend()
+        features = np.zeros((1, 20, 174, 1), dtype=np.float32)
+        backend.predict(features)
+        print(f"Per window: model inference {per_call_ms(lambda: backend.predict(features), 100):.2f} ms")
+    except Exception as e:
+        print(f"Model not available for timing inference: {e}")
@@ -0,0 +1,275 @@
+import heapq, math, time
+import numpy as np
+from array import array
+from xml.etree import ElementTree
+from src.geofence_index import haversine_meters, METERS_PER_DEG_LAT, METERS_PER_DEG_LON, EARTH_RADIUS_METERS
+
+# OSM highway values that are routable for the driving profile used by /safe_route
+DRIVABLE_HIGHWAYS = {
+    "motorway", "trunk", "primary", "secondary", "tertiary", "unclassified", "residential",
+    "motorway_link", "trunk_link", "primary_link", "secondary_link", "tertiary_link",
+    "living_street", "service", "road",
+}
+
+class RoadGraph:
+    '''
+    Directed road graph in compressed sparse row form.
+
+    Node coordinates are NumPy arrays; the adjacency (indptr, indices) and edge lengths in meters
+    are typed `array` buffers so the search loop reads plain Python numbers without per-node objects.
+    '''
+    def __init__(self, lats, lons, sources, targets):
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        order = np.argsort(sources, kind="stable")
+        sources = sources[order]
+        targets = targets[order]
+        indptr = np.zeros(len(self.lats) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=len(self.lats)), out=indptr[1:])
+        self.sources = sources
+        self.targets = targets
+        self.lengths = _haversine_array(self.lats[sources], self.lons[sources], self.lats[targets], self.lons[targets])
+        self.indptr = array("q", indptr.tobytes())
+        self.indices = array("q", targets.tobytes())
+        # Plain float buffers for the search loop, avoiding NumPy scalar indexing
+        self.lat_buffer = array("d", self.lats.tobytes())
+        self.lon_buffer = array("d", self.lons.tobytes())
+
+    def __len__(self):
+        return len(self.lats)
+
+    @classmethod
+    def from_edges(cls, lats, lons, edges, oneway=()):
+        '''
+        Build from node coordinates and (u, v) pairs. Edges are two-way unless their position is in `oneway`.
+        '''
+        oneway = set(oneway)
+        sources, targets = [], []
+        for i, (u, v) in enumerate(edges):
+            sources.append(u)
+            targets.append(v)
+            if i not in oneway:
+                sources.append(v)
+                targets.append(u)
+        return cls(lats, lons, sources, targets)
+
+    @classmethod
+    def grid(cls, rows, cols, lat0=12.9, lon0=80.1, spacing_meters=100.0):
+        '''
+        Synthetic rows x cols street grid, used for tests and benchmarks.
+        '''
+        dlat = spacing_meters / METERS_PER_DEG_LAT
+        dlon = spacing_meters / (METERS_PER_DEG_LON * math.cos(math.radians(lat0)))
+        r, c = np.divmod(np.arange(rows * cols), cols)
+        lats = lat0 + r * dlat
+        lons = lon0 + c * dlon
+        node = np.arange(rows * cols).reshape(rows, cols)
+        horizontal = np.stack([node[:, :-1].ravel(), node[:, 1:].ravel()], axis=1)
+        vertical = np.stack([node[:-1, :].ravel(), node[1:, :].ravel()], axis=1)
+        pairs = np.concatenate([horizontal, vertical])
+        return cls(lats, lons, np.concatenate([pairs[:, 0], pairs[:, 1]]), np.concatenate([pairs[:, 1], pairs[:, 0]]))
+
+    @classmethod
+    def from_osm(cls, path, highways=DRIVABLE_HIGHWAYS):
+        '''
+        Build from an OSM XML extract, keeping only nodes that are part of drivable ways.
+        '''
+        coords = {}
+        ways = []
+        for _, elem in ElementTree.iterparse(path, events=("end",)):
+            if elem.tag == "node":
+                coords[int(elem.get("id"))] = (float(elem.get("lat")), float(elem.get("lon")))
+                elem.clear()
+            elif elem.tag == "way":
+                tags = {tag.get("k"): tag.get("v") for tag in elem.iter("tag")}
+                if tags.get("highway") in highways:
+                    refs = [int(nd.get("ref")) for nd in elem.iter("nd")]
+                    oneway = tags.get("oneway")
+                    if oneway == "-1":
+                        refs.reverse()
+                    ways.append((refs, oneway in ("yes", "true", "1", "-1") or tags.get("junction") == "roundabout"))
+                elem.clear()
+
+        compact = {}
+        sources, targets = [], []
+        for refs, oneway in ways:
+            refs = [ref for ref in refs if ref in coords]
+            for u, v in zip(refs, refs[1:]):
+                u = compact.setdefault(u, len(compact))
+                v = compact.setdefault(v, len(compact))
+                sources.append(u)
+                targets.append(v)
+                if not oneway:
+                    sources.append(v)
+                    targets.append(u)
+        lats = np.empty(len(compact))
+        lons = np.empty(len(compact))
+        for osm_id, i in compact.items():
+            lats[i], lons[i] = coords[osm_id]
+        return cls(lats, lons, sources, targets)
+
+    def save(self, path):
+        np.savez(path, lats=self.lats, lons=self.lons, sources=self.sources, targets=self.targets)
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Load a graph saved with save() (.npz) or parse an OSM XML extract.
+        '''
+        if path.endswith(".npz"):
+            data = np.load(path)
+            return cls(data["lats"], data["lons"], data["sources"], data["targets"])
+        return cls.from_osm(path)
+
+    def nearest_node(self, lat, lon, max_distance_meters=None):
+        '''
+        Index of the node closest to (lat, lon), or None if it is more than `max_distance_meters` away
+        (the point is outside the area the graph covers).
+        '''
+        # Equirectangular distance is enough to pick the closest node
+        dx = (self.lons - lon) * math.cos(math.radians(lat))
+        dy = self.lats - lat
+        node = int(np.argmin(dx * dx + dy * dy))
+        if max_distance_meters is not None and haversine_meters(lat, lon, self.lat_buffer[node], self.lon_buffer[node]) > max_distance_meters:
+            return None
+        return node
+
+def _haversine_array(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+class LocalRouter:
+    '''
+    Offline A* router over a RoadGraph with edge costs penalized near geofences.
+
+    cost = length * (1 + risk_penalty * exposure), where exposure is 1 inside a geofence and falls
+    linearly to 0 at `risk_buffer_meters` outside it (taken at the edge midpoint). Costs never drop
+    below the edge length, so the straight-line distance stays an admissible A* heuristic.
+    Endpoints are snapped to the nearest node, at most `max_snap_meters` away.
+    '''
+    def __init__(self, graph, risk_penalty=10.0, risk_buffer_meters=100.0, max_snap_meters=300.0):
+        self.graph = graph
+        self.max_snap_meters = max_snap_meters
+        self.risk_penalty = risk_penalty
+        self.risk_buffer_meters = risk_buffer_meters
+        self.version = None
+        self.costs = array("d", graph.lengths.tobytes())
+
+    def apply_risk(self, geofences, version):
+        '''
+        Recompute edge costs for a geofence set. Skipped if the geofence version has not changed.
+        '''
+        if version is not None and version == self.version:
+            return
+        graph = self.graph
+        exposure = np.zeros(len(graph.lengths))
+        if geofences:
+            # Edge midpoints sorted by latitude so each fence only touches the slice it can reach
+            mid_lats = (graph.lats[graph.sources] + graph.lats[graph.targets]) / 2
+            mid_lons = (graph.lons[graph.sources] + graph.lons[graph.targets]) / 2
+            order = np.argsort(mid_lats)
+            sorted_lats = mid_lats[order]
+            for geofence in geofences:
+                lat, lon = float(geofence["center_lat"]), float(geofence["center_long"])
+                radius = float(geofence["radius_meters"])
+                reach_deg = (radius + self.risk_buffer_meters) * 1.01 / METERS_PER_DEG_LAT
+                lo = np.searchsorted(sorted_lats, lat - reach_deg, side="left")
+                hi = np.searchsorted(sorted_lats, lat + reach_deg, side="right")
+                if lo >= hi:
+                    continue
+                edges = order[lo:hi]
+                distance = _haversine_array(lat, lon, mid_lats[edges], mid_lons[edges])
+                outside = np.maximum(distance - radius, 0.0)
+                if self.risk_buffer_meters:
+                    near = np.clip(1.0 - outside / self.risk_buffer_meters, 0.0, 1.0)
+                else:
+                    near = (outside == 0).astype(np.float64)
+                exposure[edges] = np.maximum(exposure[edges], near)
+        costs = graph.lengths * (1.0 + self.risk_penalty * exposure)
+        self.costs = array("d", costs.tobytes())
+        self.version = version
+
+    def route(self, start_coords, end_coords):
+        '''
+        Safest route between two (lat, lon) points as a list of [lon, lat] coordinates,
+        in the same order as the OpenRouteService geometry. Returns None if unreachable, or if either
+        point is more than max_snap_meters from the road graph.
+        '''
+        graph = self.graph
+        source = graph.nearest_node(*start_coords, max_distance_meters=self.max_snap_meters)
+        target = graph.nearest_node(*end_coords, max_distance_meters=self.max_snap_meters)
+        if source is None or target is None:
+            return None
+        path = self._astar(source, target)
+        if path is None:
+            return None
+        return [[graph.lon_buffer[node], graph.lat_buffer[node]] for node in path]
+
+    def _astar(self, source, target):
+        indptr, indices, costs = self.graph.indptr, self.graph.indices, self.costs
+        lats, lons = self.graph.lat_buffer, self.graph.lon_buffer
+        goal_lat, goal_lon = lats[target], lons[target]
+        best = {source: 0.0}
+        parent = {source: -1}
+        closed = set()
+        heap = [(haversine_meters(lats[source], lons[source], goal_lat, goal_lon), 0.0, source)]
+
+        while heap:
+            _, cost, node = heapq.heappop(heap)
+            if node == target:
+                path = []
+                while node != -1:
+                    path.append(node)
+                    node = parent[node]
+                return path[::-1]
+            if node in closed:
+                continue
+            closed.add(node)
+            for edge in range(indptr[node], indptr[node + 1]):
+                neighbour = indices[edge]
+                new_cost = cost + costs[edge]
+                if new_cost < best.get(neighbour, math.inf):
+                    best[neighbour] = new_cost
+                    parent[neighbour] = node
+                    heuristic = haversine_meters(lats[neighbour], lons[neighbour], goal_lat, goal_lon)
+                    heapq.heappush(heap, (new_cost + heuristic, new_cost, neighbour))
+        return None
+
+# Benchmark
+if __name__=="__main__":
+    import random
+
+    random.seed(5)
+    start = time.perf_counter()
+    graph = RoadGraph.grid(300, 300)
+    print(f"Grid graph: {len(graph)} nodes, {len(graph.indices)} edges, built in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    fences = [{
+        "id": i,
+        "center_lat": random.uniform(graph.lats.min(), graph.lats.max()),
+        "center_long": random.uniform(graph.lons.min(), graph.lons.max()),
+        "radius_meters": random.uniform(50, 300),
+    } for i in range(500)]
+    router = LocalRouter(graph)
+    start = time.perf_counter()
+    router.apply_risk(fences, version=1)
+    print(f"Risk weighting for {len(fences)} geofences: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    timings = []
+    for _ in range(50):
+        a = (random.uniform(graph.lats.min(), graph.lats.max()), random.uniform(graph.lons.min(), graph.lons.max()))
+        b = (random.uniform(graph.lats.min(), graph.lats.max()), random.uniform(graph.lons.min(), graph.lons.max()))
+        start = time.perf_counter()
+        router.route(a, b)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    print(f"Route latency: p50 {timings[len(timings) // 2] * 1000:.1f} ms, max {timings[-1] * 1000:.1f} ms")
+
+    # Endpoints outside the graph are not snapped to its edge: 1 km past the last row is out of coverage
+    inside = (graph.lats.max() - 0.001, graph.lons.max() - 0.001)
+    outside = (graph.lats.max() + 1000 / METERS_PER_DEG_LAT, graph.lons.max())
+    assert router.route(inside, (graph.lats.min(), graph.lons.min())) is not None
+    assert router.route(inside, outside) is None and router.route(outside, inside) is None
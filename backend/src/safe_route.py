@@ -1,21 +1,148 @@
-import requests, os
+import os, sys, math, time, asyncio, threading
+import httpx
 from dotenv import load_dotenv
 from src.utils.exception import customException
-from src.database.supabase_config import Supabase
+from src.geofences import geofence_cache
+from src.routing_engine import RoadGraph, LocalRouter
+from src.utils.cache import LRUCache
+from src.services.http_client import http_client
+from src.utils.logger import logging
 
-supa_client=Supabase()
-HIGH_RISK_ZONES=[]
 load_dotenv()
 
+class RiskZoneIndex:
+    '''
+    Grid hash over geofence centers for route filtering.
+    A coordinate is in a high-risk zone when it is within `box_deg` of a zone center in both latitude
+    and longitude. With the cell size equal to box_deg only the 3x3 neighbouring cells can hold a match,
+    so each lookup costs O(1) regardless of the number of zones.
+    '''
+    def __init__(self, box_deg=0.01):
+        self.box_deg = box_deg
+        self.version = None
+        self.cells = {}
+
+    def _cell(self, lon, lat):
+        return int(math.floor(lon / self.box_deg)), int(math.floor(lat / self.box_deg))
+
+    def build(self, geofences, version):
+        cells = {}
+        for item in geofences:
+            zone = (float(item['center_long']), float(item['center_lat']))
+            cells.setdefault(self._cell(*zone), []).append(zone)
+        # Swap in one assignment so concurrent readers never see a half-built grid
+        self.cells = cells
+        self.version = version
+
+    def __len__(self):
+        return sum(len(zones) for zones in self.cells.values())
+
+    def contains(self, coord):
+        '''
+        coord is a [lon, lat] pair as returned by OpenRouteService.
+        '''
+        lon, lat = coord[0], coord[1]
+        cells = self.cells
+        col, row = self._cell(lon, lat)
+        for dc in (-1, 0, 1):
+            for dr in (-1, 0, 1):
+                for zone_lon, zone_lat in cells.get((col + dc, row + dr), ()):
+                    if abs(zone_lon - lon) < self.box_deg and abs(zone_lat - lat) < self.box_deg:
+                        return True
+        return False
+
+HIGH_RISK_ZONES=RiskZoneIndex()
+
+class RouteCache:
+    '''
+    LRU + TTL cache of safe routes.
+    Keys are the start/end points snapped to a `grid_deg` grid plus the geofence cache version,
+    so requests from nearby points share a route and any geofence change makes old routes unreachable.
+    Memory is capped by an estimate of the size of the cached coordinate lists.
+    '''
+    # Rough CPython footprint of one [lon, lat] list of two floats inside the route list
+    BYTES_PER_POINT = 120
+
+    def __init__(self, grid_deg=0.001, ttl=600, max_entries=10000, max_bytes=64 * 1024 * 1024):
+        self.grid_deg = grid_deg
+        self.cache = LRUCache(max_entries=max_entries, ttl=ttl, max_bytes=max_bytes,
+                              sizeof=lambda route: 64 + self.BYTES_PER_POINT * len(route))
+
+    def key(self, start_coords, end_coords, version):
+        snap = lambda value: int(round(value / self.grid_deg))
+        return (snap(start_coords[0]), snap(start_coords[1]), snap(end_coords[0]), snap(end_coords[1]), version)
+
+    def get(self, start_coords, end_coords, version):
+        return self.cache.get(self.key(start_coords, end_coords, version))
+
+    def put(self, start_coords, end_coords, version, route):
+        self.cache.set(self.key(start_coords, end_coords, version), route)
+
+    def stats(self):
+        return self.cache.stats()
+
 class OpenRouteService:
-    def __init__(self):
+    def __init__(self, geofences=geofence_cache, router=None):
         self.api_key = os.getenv("ORS_API_KEY")
+        self.geofences = geofences
+        # Set ROAD_GRAPH_PATH (.osm or .npz) to route offline instead of calling api.openrouteservice.org
+        self.road_graph_path = os.getenv("ROAD_GRAPH_PATH")
+        self.router = router
+        self._router_lock = threading.Lock()
+        self.route_cache = RouteCache(
+            grid_deg=float(os.getenv("ROUTE_CACHE_GRID_DEG", "0.001")),
+            ttl=float(os.getenv("ROUTE_CACHE_TTL_SECONDS", "600")),
+            max_entries=int(os.getenv("ROUTE_CACHE_MAX_ENTRIES", "10000")),
+            max_bytes=int(os.getenv("ROUTE_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+        )
+
+    def get_local_router(self):
+        """
+        Loads the offline road graph on first use. Returns None when no graph is configured.
+        Loading parses and indexes the whole graph, so call this from a worker thread (or the warm-up phase),
+        never on the event loop. Concurrent first callers wait for a single load.
+        """
+        if self.router is None and self.road_graph_path:
+            with self._router_lock:
+                if self.router is None:
+                    self.router = LocalRouter(
+                        RoadGraph.load(self.road_graph_path),
+                        risk_penalty=float(os.getenv("ROUTE_RISK_PENALTY", "10")),
+                        risk_buffer_meters=float(os.getenv("ROUTE_RISK_BUFFER_METERS", "100")),
+                        max_snap_meters=float(os.getenv("ROUTE_MAX_SNAP_METERS", "300")),
+                    )
+        return self.router
 
     # Helper function to calculate the safest route
-    def get_safest_route(self, start_coords, end_coords):
+    async def get_safest_route(self, start_coords, end_coords):
         """
         Calculate route from start to end while avoiding high-risk areas.
+        Routes are cached per snapped endpoints and geofence version.
         """
+        version = self.geofences.version
+        route = self.route_cache.get(start_coords, end_coords, version)
+        if route is None:
+            route = await self.compute_safest_route(start_coords, end_coords, version)
+            if route:
+                self.route_cache.put(start_coords, end_coords, version, route)
+        return route
+
+    def local_route(self, start_coords, end_coords, version):
+        router = self.get_local_router()
+        router.apply_risk(self.geofences.geofences(), version)
+        return router.route(start_coords, end_coords)
+
+    async def compute_safest_route(self, start_coords, end_coords, version):
+        if self.router is not None or self.road_graph_path:
+            # Offline A* over the road graph, with edges near geofences penalized instead of dropped.
+            # Loading the graph on first use and the search are CPU bound, so both run in a worker thread
+            # to keep the event loop responsive
+            route = await asyncio.to_thread(self.local_route, start_coords, end_coords, version)
+            # Endpoints outside the graph (or not connected by it) fall back to OpenRouteService when it is configured
+            if route is not None or not self.api_key:
+                return route
+            logging.info(f"No offline route from {start_coords} to {end_coords}, falling back to OpenRouteService")
+
         try:
             url = "https://api.openrouteservice.org/v2/directions/driving-car"
             headers = {"Authorization": self.api_key}
@@ -25,7 +152,7 @@ class OpenRouteService:
             }
 
             # Send the request to OpenRouteService
-            response = requests.get(url, headers=headers, params=params)
+            response = await http_client.get(url, headers=headers, params=params)
             response.raise_for_status()  # Raise an error for HTTP errors
 
             # Parse the JSON response
@@ -36,47 +163,61 @@ class OpenRouteService:
 
             return safe_route
 
-        except requests.exceptions.HTTPError as http_err:
-            raise customException(http_err)
-        except requests.exceptions.RequestException as req_err:
-            raise customException(req_err)
+        except httpx.HTTPStatusError as http_err:
+            raise customException(http_err, sys)
+        except httpx.HTTPError as req_err:
+            raise customException(req_err, sys)
         except Exception as e:
-            raise customException(e)
+            raise customException(e, sys)
 
     def filter_safe_route(self, coordinates):
         """
         Filters out route coordinates that fall within high-risk zones.
         """
-        safe_coords = []
-        self.get_high_risk_zones()
-        for coord in coordinates:
-            if not self.is_in_high_risk_zone(coord):
-                safe_coords.append(coord)
-        return safe_coords
+        zones = self.get_high_risk_zones()
+        return [coord for coord in coordinates if not zones.contains(coord)]
 
     def is_in_high_risk_zone(self,coord):
         """
         Check if a coordinate falls within any high-risk zone.
         """
-        for zone in HIGH_RISK_ZONES:
-            if (abs(zone["lon"] - coord[0]) < 0.01) and (abs(zone["lat"] - coord[1]) < 0.01):
-                return True
-        return False
+        return self.get_high_risk_zones().contains(coord)
     
     def get_high_risk_zones(self):
         """
-        Converts a list of high-risk area data into the required HIGH_RISK_ZONES format.
+        Returns the high-risk zone index, rebuilt only when the geofence cache version changes.
         """
-        data=supa_client.get_geofence()
-        for item in data:
-            HIGH_RISK_ZONES.append({
-                "lon": item['center_long'],
-                "lat": item['center_lat']
-            })
+        if HIGH_RISK_ZONES.version != self.geofences.version:
+            version = self.geofences.version
+            HIGH_RISK_ZONES.build(self.geofences.geofences(), version)
+        return HIGH_RISK_ZONES
 
+# Benchmark
 if __name__=="__main__":
-    ors=OpenRouteService()
-    a = (12.8150, 80.1600)
-    b = (12.9400, 80.1300)
-    res=ors.get_safest_route(a,b)
-    print(res)
+    import random, tracemalloc
+
+    class _StaticGeofences:
+        version = 1
+        def __init__(self, rows):
+            self.rows = rows
+        def geofences(self):
+            return self.rows
+
+    random.seed(11)
+    rows = [{"center_lat": 12.9 + random.uniform(-0.5, 0.5), "center_long": 80.1 + random.uniform(-0.5, 0.5)} for _ in range(20000)]
+    ors = OpenRouteService(geofences=_StaticGeofences(rows))
+    route = [[80.1 + random.uniform(-0.5, 0.5), 12.9 + random.uniform(-0.5, 0.5)] for _ in range(500)]
+
+    tracemalloc.start()
+    timings = []
+    for i in range(1000):
+        start = time.perf_counter()
+        ors.filter_safe_route(route)
+        timings.append(time.perf_counter() - start)
+        if i == 0:
+            baseline = tracemalloc.get_traced_memory()[0]
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{len(rows)} zones, {len(route)} route points, {len(HIGH_RISK_ZONES)} zones indexed after 1000 requests")
+    print(f"First 100 requests: {sum(timings[:100]) / 100 * 1000:.3f} ms/request, last 100: {sum(timings[-100:]) / 100 * 1000:.3f} ms/request")
+    print(f"Traced memory after first request: {baseline / 1024:.0f} KiB, after 1000: {current / 1024:.0f} KiB, peak {peak / 1024:.0f} KiB")
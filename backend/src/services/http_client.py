@@ -0,0 +1,90 @@
+import asyncio, os, random
+import httpx
+from src.utils.logger import logging
+
+# Statuses worth retrying: rate limiting and transient upstream failures
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# Errors raised before the request reached the server, safe to retry for any method
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+class HTTPClient:
+    '''
+    Shared async HTTP client for outbound API calls.
+
+    Keeps one pooled, keep-alive httpx.AsyncClient per host, applies timeouts to every request and retries
+    with jittered exponential backoff. Idempotent methods (or calls made with idempotent=True) are retried
+    on transport errors and RETRY_STATUSES; other requests are only retried when they never reached the server.
+    '''
+    def __init__(self, timeout=10.0, connect_timeout=5.0, max_connections=20, max_keepalive=10, retries=3, backoff_base=0.2, backoff_max=3.0):
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._clients = {}
+
+    def client_for(self, url):
+        host = httpx.URL(url).host
+        client = self._clients.get(host)
+        if client is None or client.is_closed:
+            client = self._clients[host] = httpx.AsyncClient(timeout=self.timeout, limits=self.limits)
+        return client
+
+    def _backoff(self, attempt):
+        # Full jitter: uniform between 0 and the capped exponential delay
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def request(self, method, url, idempotent=None, retries=None, **kwargs):
+        method = method.upper()
+        idempotent = method in IDEMPOTENT_METHODS if idempotent is None else idempotent
+        retries = self.retries if retries is None else retries
+        client = self.client_for(url)
+
+        for attempt in range(retries + 1):
+            try:
+                response = await client.request(method, url, **kwargs)
+            except NOT_SENT_ERRORS as e:
+                if attempt == retries:
+                    raise
+                logging.warning(f"{method} {url} failed before sending ({e!r}), retrying.")
+            except httpx.TransportError as e:
+                if not idempotent or attempt == retries:
+                    raise
+                logging.warning(f"{method} {url} failed ({e!r}), retrying.")
+            else:
+                if not (idempotent and response.status_code in RETRY_STATUSES and attempt < retries):
+                    return response
+                logging.warning(f"{method} {url} returned {response.status_code}, retrying.")
+            await asyncio.sleep(self._backoff(attempt))
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    async def prime(self, urls):
+        '''
+        Open pooled connections (DNS, TCP and TLS) to the hosts of `urls` ahead of the first real request.
+        Returns {host: None or error string}; any HTTP response counts as success.
+        '''
+        async def open_connection(url):
+            try:
+                await self.client_for(url).head(url)
+                return None
+            except httpx.HTTPError as e:
+                return repr(e)
+
+        results = await asyncio.gather(*[open_connection(url) for url in urls])
+        return {httpx.URL(url).host: error for url, error in zip(urls, results)}
+
+    async def aclose(self):
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+http_client = HTTPClient(
+    timeout=float(os.getenv("HTTP_TIMEOUT_SECONDS", "10")),
+    retries=int(os.getenv("HTTP_RETRIES", "3")),
+)
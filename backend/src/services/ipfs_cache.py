@@ -0,0 +1,103 @@
+import os, re, threading
+from src.utils.cache import LRUCache
+from src.utils.logger import logging
+
+# CIDv0 is base58, CIDv1 is usually base32; both are plain alphanumerics
+CID_PATTERN = re.compile(r"^[A-Za-z0-9]{16,128}$")
+
+class IPFSCache:
+    '''
+    Content-addressed cache for IPFS reads.
+
+    Content behind a CID never changes, so entries are never invalidated, only evicted for space:
+    - a memory LRU bounded by `memory_bytes`,
+    - a directory of one file per CID bounded by `disk_bytes`, evicting the least recently read files.
+    '''
+    def __init__(self, directory="ipfs_cache", memory_bytes=64 * 1024 * 1024, disk_bytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.disk_bytes = disk_bytes
+        self.memory = LRUCache(max_entries=100000, max_bytes=memory_bytes, sizeof=len)
+        self._lock = threading.Lock()
+        self.disk_hits = 0
+        self.disk_usage = 0
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            self.disk_usage += os.path.getsize(os.path.join(directory, name))
+
+    def _path(self, cid):
+        return os.path.join(self.directory, cid)
+
+    def get(self, cid):
+        '''
+        Cached content for a CID, or None.
+        '''
+        if not CID_PATTERN.match(cid):
+            return None
+        content = self.memory.get(cid)
+        if content is not None:
+            return content
+        path = self._path(cid)
+        try:
+            with open(path, "rb") as f:
+                content = f.read()
+            # Reads refresh the timestamp used for LRU eviction on disk
+            os.utime(path)
+        except OSError:
+            return None
+        self.disk_hits += 1
+        self.memory.set(cid, content)
+        return content
+
+    def put(self, cid, content):
+        if not CID_PATTERN.match(cid):
+            return
+        self.memory.set(cid, content)
+        if len(content) > self.disk_bytes:
+            return
+        path = self._path(cid)
+        try:
+            with self._lock:
+                if os.path.exists(path):
+                    return
+                # Write to a temporary name first so readers never see a partial file
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(content)
+                os.replace(tmp_path, path)
+                self.disk_usage += len(content)
+                if self.disk_usage > self.disk_bytes:
+                    self._evict()
+        except OSError as e:
+            logging.error(f"Failed to write IPFS content {cid} to the disk cache: {e}")
+
+    def _evict(self):
+        # Drop the least recently read files until the disk tier is back to 90% of its budget
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        for _, size, path in entries:
+            if self.disk_usage <= self.disk_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+                self.disk_usage -= size
+            except OSError:
+                pass
+
+    def stats(self):
+        stats = self.memory.stats()
+        stats["disk_hits"] = self.disk_hits
+        stats["disk_bytes"] = self.disk_usage
+        return stats
+
+ipfs_cache = IPFSCache(
+    directory=os.getenv("IPFS_CACHE_DIR", "ipfs_cache"),
+    memory_bytes=int(os.getenv("IPFS_CACHE_MEMORY_BYTES", str(64 * 1024 * 1024))),
+    disk_bytes=int(os.getenv("IPFS_CACHE_DISK_BYTES", str(512 * 1024 * 1024))),
+)
@@ -0,0 +1,124 @@
+import asyncio, random, time
+from src.utils.logger import logging
+
+class NotificationDispatcher:
+    '''
+    Sends every WhatsApp message and emergency call of an SOS concurrently.
+
+    Each provider has its own concurrency cap, so a burst of SOS alerts cannot exceed the provider's rate
+    limits. Each attempt is bounded by `timeout` seconds. Failed attempts are retried up to `retries` times
+    with jittered backoff. Timed-out attempts are not retried because the message or call may still have
+    gone out. Every recipient and channel gets a result dict:
+        {"channel", "name", "phone_number", "ok", "attempts", "latency_ms", "error"}
+    '''
+    def __init__(self, whatsapp, twilio, whatsapp_concurrency=10, call_concurrency=5, timeout=10.0, retries=2, backoff_base=0.3):
+        self.whatsapp = whatsapp
+        self.twilio = twilio
+        self.limits = {"whatsapp": whatsapp_concurrency, "call": call_concurrency}
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self._semaphores = None
+
+    def _semaphore(self, channel):
+        # Created lazily so they bind to the running event loop
+        if self._semaphores is None:
+            self._semaphores = {name: asyncio.Semaphore(limit) for name, limit in self.limits.items()}
+        return self._semaphores[channel]
+
+    async def _send_whatsapp(self, user_details, contact):
+        data = {
+            "recipient": contact["name"],
+            "user": user_details["username"],
+            "latitude": user_details["latitude"],
+            "longitude": user_details["longitude"]
+        }
+        return await self.whatsapp.send_whatsapp_message(contact["phone_number"], data)
+
+    async def _place_call(self, user_details, contact):
+        # The Twilio SDK is blocking, so each call runs on its own worker thread
+        return bool(await asyncio.to_thread(self.twilio.call_contact, user_details["username"], contact["phone_number"]))
+
+    async def _deliver(self, channel, send, user_details, contact, start):
+        result = {"channel": channel, "name": contact["name"], "phone_number": contact["phone_number"], "ok": False, "attempts": 0, "latency_ms": None, "error": None}
+        async with self._semaphore(channel):
+            for attempt in range(self.retries + 1):
+                result["attempts"] += 1
+                try:
+                    if await asyncio.wait_for(send(user_details, contact), self.timeout):
+                        result["ok"] = True
+                        result["error"] = None
+                        break
+                    result["error"] = "Provider rejected the request"
+                except asyncio.TimeoutError:
+                    result["error"] = f"Timed out after {self.timeout}s"
+                    break
+                except Exception as e:
+                    result["error"] = str(e)
+                if attempt < self.retries:
+                    await asyncio.sleep(random.uniform(0, self.backoff_base * (2 ** attempt)))
+        result["latency_ms"] = (time.perf_counter() - start) * 1000
+        if result["ok"]:
+            logging.info(f'Notified {contact["name"]} at {contact["phone_number"]} via {channel}')
+        else:
+            logging.error(f'Failed to notify {contact["name"]} at {contact["phone_number"]} via {channel}: {result["error"]}')
+        return result
+
+    async def deliver(self, channel, user_details, contact):
+        '''
+        Notify one contact on one channel ("whatsapp" or "call"). Returns the result dict.
+        '''
+        send = self._send_whatsapp if channel == "whatsapp" else self._place_call
+        return await self._deliver(channel, send, user_details, contact, time.perf_counter())
+
+    async def dispatch(self, user_details, contacts):
+        '''
+        Notify all contacts on all channels at once. Returns the per-recipient results.
+        '''
+        start = time.perf_counter()
+        tasks = []
+        for contact in contacts:
+            tasks.append(self._deliver("whatsapp", self._send_whatsapp, user_details, contact, start))
+            tasks.append(self._deliver("call", self._place_call, user_details, contact, start))
+        results = await asyncio.gather(*tasks)
+        delivered = [result["latency_ms"] for result in results if result["ok"]]
+        logging.info(
+            f"Dispatched {len(results)} notifications for {user_details['user_id']}: {len(delivered)} delivered, "
+            f"first after {min(delivered, default=0):.1f} ms, all done after {(time.perf_counter() - start) * 1000:.1f} ms"
+        )
+        return results
+
+if __name__=="__main__":
+    # Five contacts with simulated provider latencies: sequential fan-out versus the dispatcher
+    SEND_S, CALL_S = 0.4, 0.8
+    contacts = [{"name": f"Contact {i}", "relation": "Family", "phone_number": f"+9100000000{i}"} for i in range(5)]
+    user = {"user_id": "user", "username": "User", "latitude": 12.97, "longitude": 77.59}
+
+    class _WhatsApp:
+        async def send_whatsapp_message(self, phone_number, data):
+            await asyncio.sleep(SEND_S)
+            return True
+
+    class _Twilio:
+        def call_contact(self, user_name, number):
+            time.sleep(CALL_S)
+            return "CA" + number
+
+    async def sequential():
+        start = time.perf_counter()
+        for contact in contacts:
+            await _WhatsApp().send_whatsapp_message(contact["phone_number"], {})
+        for contact in contacts:
+            _Twilio().call_contact(user["username"], contact["phone_number"])
+        return (time.perf_counter() - start) * 1000
+
+    async def concurrent():
+        dispatcher = NotificationDispatcher(_WhatsApp(), _Twilio())
+        start = time.perf_counter()
+        results = await dispatcher.dispatch(user, contacts)
+        assert all(result["ok"] for result in results)
+        return (time.perf_counter() - start) * 1000
+
+    print(f"{len(contacts)} contacts, {SEND_S * 1000:.0f} ms per message, {CALL_S * 1000:.0f} ms per call")
+    print(f"Sequential: {asyncio.run(sequential()):.0f} ms to notify everyone")
+    print(f"Dispatcher: {asyncio.run(concurrent()):.0f} ms to notify everyone")
@@ -0,0 +1,103 @@
+import asyncio, os, re, sqlite3, threading, time, unicodedata
+from dotenv import load_dotenv
+from src.utils.cache import LRUCache
+from src.services.http_client import http_client
+from src.utils.logger import logging
+
+load_dotenv()
+
+def normalize_query(location):
+    '''
+    Canonical form of a geocoding query: Unicode NFKC, case folded, whitespace collapsed (and spaced the
+    same way around commas). Punctuation is kept, since signs, decimal points and hyphens change the place:
+    "  MG Road ,Bengaluru " and "mg road, bengaluru" share one cache entry, "-33.86, 151.2" and "33.86, 151.2" do not.
+    '''
+    text = unicodedata.normalize("NFKC", location).casefold()
+    text = re.sub(r"\s*,\s*", ", ", text)
+    return re.sub(r"\s+", " ", text).strip(" ,")
+
+class OpenCage:
+    '''
+    OpenCage geocoder with a two-level cache.
+
+    Lookups go to an in-memory LRU first, then to a SQLite store that survives restarts, and only then
+    to the OpenCage API through the shared async HTTP client. Concurrent lookups of the same normalized
+    query wait for a single upstream request.
+    '''
+    URL = "https://api.opencagedata.com/geocode/v1/json"
+
+    def __init__(self, cache_path=None, max_entries=10000):
+        self.api_key = os.getenv("OPEN_CAGE_API")
+        self.memory = LRUCache(max_entries=max_entries)
+        self.cache_path = cache_path or os.getenv("GEOCODE_CACHE_PATH", "geocode_cache.sqlite3")
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(self.cache_path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS geocodes (query TEXT PRIMARY KEY, lat REAL, lng REAL, created_at REAL)")
+        self._db.commit()
+        self._inflight = {}
+        self.upstream_requests = 0
+
+    async def geocode(self, location):
+        '''
+        Returns {"center_lat", "center_long"} for a location string, or None if it could not be resolved.
+        '''
+        key = normalize_query(location)
+        if not key:
+            return None
+        loc = self.memory.get(key)
+        if loc is not None:
+            return dict(loc)
+        loc = self._load(key)
+        if loc is not None:
+            self.memory.set(key, loc)
+            return dict(loc)
+
+        # Coalesce concurrent lookups of the same query onto one upstream request
+        pending = self._inflight.get(key)
+        if pending is None:
+            pending = self._inflight[key] = asyncio.get_running_loop().create_task(self._resolve(key, location))
+        # Shielded so a cancelled caller does not cancel the lookup other callers are waiting on
+        loc = await asyncio.shield(pending)
+        return dict(loc) if loc else None
+
+    async def _resolve(self, key, location):
+        try:
+            loc = await self._fetch(location)
+            if loc is not None:
+                self.memory.set(key, loc)
+                self._store(key, loc)
+            return loc
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _fetch(self, location):
+        self.upstream_requests += 1
+        response = await http_client.get(self.URL, params={"q": location, "key": self.api_key, "limit": 1, "no_annotations": 1})
+        response.raise_for_status()
+        results = response.json().get("results")
+        if results:
+            return {
+                "center_lat": results[0]['geometry']['lat'],
+                "center_long": results[0]['geometry']['lng']
+            }
+        return None
+
+    def _load(self, key):
+        with self._db_lock:
+            row = self._db.execute("SELECT lat, lng FROM geocodes WHERE query = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return {"center_lat": row[0], "center_long": row[1]}
+
+    def _store(self, key, loc):
+        try:
+            with self._db_lock:
+                self._db.execute("INSERT OR REPLACE INTO geocodes VALUES (?, ?, ?, ?)", (key, loc["center_lat"], loc["center_long"], time.time()))
+                self._db.commit()
+        except sqlite3.Error as e:
+            logging.error(f"Failed to persist geocode for '{key}': {e}")
+
+    def stats(self):
+        stats = self.memory.stats()
+        stats["upstream_requests"] = self.upstream_requests
+        return stats
@@ -1,14 +1,18 @@
-import requests, os
+import os, json
+import httpx
 from dotenv import load_dotenv
+from src.services.http_client import http_client
+from src.services.ipfs_cache import ipfs_cache
 
 load_dotenv()
 
 class Pinata:
-    def __init__(self):
+    def __init__(self, cache=ipfs_cache):
         self.PINATA_API_KEY=os.getenv("PINATA_API_KEY")
         self.PINATA_SECRET_API_KEY=os.getenv("PINATA_API_Secret")
+        self.cache=cache
     
-    def upload_to_pinata(self,data):
+    async def upload_to_pinata(self,data):
         url = "https://api.pinata.cloud/pinning/pinJSONToIPFS"
         headers = {
             'pinata_api_key': self.PINATA_API_KEY,
@@ -16,15 +20,29 @@ class Pinata:
             'Content-Type': 'application/json'
         }
 
-        # Make a POST request to Pinata
-        response = requests.post(url, json=data, headers=headers)
+        # Make a POST request to Pinata. Pinning is content addressed, so retrying cannot duplicate data
+        response = await http_client.post(url, json=data, headers=headers, idempotent=True)
+
+        # Write-through: the JSON we just pinned is what the gateway will serve for this hash
+        if response.status_code == 200:
+            ipfs_hash = response.json().get("IpfsHash")
+            if ipfs_hash:
+                self.cache.put(ipfs_hash, json.dumps(data).encode())
 
         return response
     
-    def get_data_from_ipfs(self,ipfs_hash):
+    async def get_data_from_ipfs(self,ipfs_hash):
         url = f"https://gateway.pinata.cloud/ipfs/{ipfs_hash}"
 
+        # Content behind a CID is immutable, so a cached copy is always valid
+        content = self.cache.get(ipfs_hash)
+        if content is not None:
+            return httpx.Response(200, content=content, request=httpx.Request("GET", url))
+
         # Make a GET request to the IPFS gateway
-        response = requests.get(url)
+        response = await http_client.get(url)
 
-        return response
\ No newline at end of file
+        if response.status_code == 200:
+            self.cache.put(ipfs_hash, response.content)
+
+        return response
@@ -1,4 +1,3 @@
-from twilio.rest import Client
 from dotenv import load_dotenv
 import os
 
@@ -6,14 +5,16 @@ load_dotenv()
 
 class Twilio:
     def __init__(self):
+        # Imported here so that importing this module stays cheap
+        from twilio.rest import Client
         ACCOUNt_SID = os.getenv("TWILIO_ACCOUNT_SID")
         AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
         self.TWILIO_NUMBER = os.getenv("TWILIO_NUMBER")
         self.client = Client(ACCOUNt_SID, AUTH_TOKEN)
 
-    def make_emergency_call(self, user_name, family_contacts):
+    def emergency_message(self, user_name):
         # Create a dynamic emergency message
-        emergency_message = (
+        return (
             f"<Response>"
             f"<Say voice='alice'>"
             f"Hello, this is an automated emergency alert from Omnipresence."
@@ -26,12 +27,20 @@ class Twilio:
             f"</Say>"
             f"</Response>"
         )
-        
+
+    def call_contact(self, user_name, number):
+        '''
+        Place one emergency call and return its Twilio call SID. Blocking.
+        '''
+        call = self.client.calls.create(
+            to=number,
+            from_=self.TWILIO_NUMBER,
+            twiml=self.emergency_message(user_name)
+        )
+        print(f"Emergency call initiated to {number}: {call.sid}")
+        return call.sid
+
+    def make_emergency_call(self, user_name, family_contacts):
         # Send emergency call to each family number
         for number in family_contacts:
-            call = self.client.calls.create(
-                to=number,
-                from_=self.TWILIO_NUMBER,
-                twiml=emergency_message
-            )
-            print(f"Emergency call initiated to {number}: {call.sid}")
+            self.call_contact(user_name, number)
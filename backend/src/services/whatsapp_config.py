@@ -1,7 +1,8 @@
-import requests
 import os
 import datetime
+import asyncio
 from dotenv import load_dotenv
+from src.services.http_client import http_client
 
 load_dotenv()
 
@@ -10,7 +11,7 @@ class WhatsApp:
         self.token = os.getenv("META_ACCESS_TOKEN")
         self.phone_id = os.getenv("META_PHONE_ID") #Phone number ID from WhatsApp Business Account
 
-    def send_whatsapp_message(self,recipient_phone,text):
+    async def send_whatsapp_message(self,recipient_phone,text):
         url = f"https://graph.facebook.com/v21.0/{self.phone_id}/messages"
         headers = {
             "Authorization": f"Bearer {self.token}",
@@ -37,13 +38,16 @@ class WhatsApp:
             }
         }
 
-        response = requests.post(url, headers=headers, json=data)
+        # Not idempotent: only retried if the request never reached Meta
+        response = await http_client.post(url, headers=headers, json=data)
         if response.status_code == 200:
             print("Message sent successfully!")
+            return True
         else:
-            print("Failed to send message:", response.json())
+            print("Failed to send message:", response.text)
+            return False
 
-    def refresh_access_token(self):
+    async def refresh_access_token(self):
         refresh_url = f"https://graph.facebook.com/v21.0/oauth/access_token"
         params = {
             "grant_type": "fb_exchange_token",
@@ -51,7 +55,7 @@ class WhatsApp:
             "client_secret": os.getenv("META_APP_SECRET"),
             "fb_exchange_token": self.token
         }
-        response = requests.get(refresh_url, params=params)
+        response = await http_client.get(refresh_url, params=params)
         if response.status_code == 200:
             new_token = response.json()["access_token"]
             # Save the new token securely
@@ -72,4 +76,4 @@ if __name__=="__main__":
         "latitude":"37.7749",
         "longitude":"-122.4194"
     }
-    meta.send_whatsapp_message(ph,data)
+    asyncio.run(meta.send_whatsapp_message(ph,data))
@@ -0,0 +1,127 @@
+import asyncio, os, sqlite3, threading, time
+from contextlib import asynccontextmanager
+from src.utils.logger import logging
+
+class SOSCoalescer:
+    '''
+    Per-user SOS coalescing window.
+
+    The first trigger from a user opens a window of `window_seconds` bound to the alert it created. Later
+    triggers inside the window attach to that alert instead of creating a new one and notifying everyone
+    again. The window is fixed from the first trigger, so an emergency that is still going on once it
+    closes raises a fresh alert.
+
+    Windows live in memory. When `path` is set they are also kept in a SQLite table shared by the workers
+    on the same host. A worker claims a user's window there before creating the alert, and other workers
+    wait for its alert id.
+
+    Usage:
+        async with coalescer.hold(user_id):
+            alert_id = await coalescer.active_alert(user_id)
+            if alert_id is None:
+                alert_id = create_alert()
+                coalescer.open(user_id, alert_id)   # or coalescer.release(user_id) if creation failed
+    '''
+    def __init__(self, window_seconds=300, path=None, claim_timeout=5.0):
+        self.window_seconds = window_seconds
+        self.claim_timeout = claim_timeout
+        self.windows = {}
+        self._locks = {}
+        self._db = None
+        self._db_lock = threading.Lock()
+        self.created = 0
+        self.coalesced = 0
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=claim_timeout)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS sos_windows (user_id TEXT PRIMARY KEY, alert_id INTEGER, opened_at REAL)")
+
+    @asynccontextmanager
+    async def hold(self, user_id):
+        '''
+        Serialize triggers of one user within this process.
+        '''
+        entry = self._locks.get(user_id)
+        if entry is None:
+            entry = self._locks[user_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[user_id]
+
+    async def active_alert(self, user_id):
+        '''
+        Alert id of the user's open window, or None if the caller must create the alert and open() the window.
+        '''
+        now = time.time()
+        window = self.windows.get(user_id)
+        if window is not None:
+            if window[1] > now - self.window_seconds:
+                self.coalesced += 1
+                return window[0]
+            del self.windows[user_id]
+        if self._db is None:
+            return None
+
+        if self._claim(user_id, now):
+            return None
+        # Another worker owns the window: use its alert, waiting while it is still being created
+        deadline = now + self.claim_timeout
+        while True:
+            row = self._shared_window(user_id)
+            if row is not None and row[0] is not None:
+                self.windows[user_id] = row
+                self.coalesced += 1
+                return row[0]
+            if row is None or time.time() >= deadline:
+                # The owner gave up or died before creating the alert
+                logging.warning(f"SOS window of {user_id} was never filled, creating a new alert.")
+                return None
+            await asyncio.sleep(0.05)
+
+    def open(self, user_id, alert_id):
+        now = time.time()
+        if len(self.windows) > 10000:
+            self.windows = {user: window for user, window in self.windows.items() if window[1] > now - self.window_seconds}
+        self.windows[user_id] = (alert_id, now)
+        self.created += 1
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("INSERT OR REPLACE INTO sos_windows VALUES (?, ?, ?)", (user_id, alert_id, now))
+
+    def release(self, user_id):
+        self.windows.pop(user_id, None)
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM sos_windows WHERE user_id = ? AND alert_id IS NULL", (user_id,))
+
+    def _claim(self, user_id, now):
+        # Insert an empty window, or take over an expired one; rowcount tells whether we won
+        with self._db_lock:
+            cursor = self._db.execute(
+                "INSERT INTO sos_windows VALUES (?, NULL, ?) ON CONFLICT(user_id) DO UPDATE SET alert_id = NULL, "
+                "opened_at = excluded.opened_at WHERE sos_windows.opened_at <= ?",
+                (user_id, now, now - self.window_seconds)
+            )
+            return cursor.rowcount == 1
+
+    def _shared_window(self, user_id):
+        with self._db_lock:
+            return self._db.execute("SELECT alert_id, opened_at FROM sos_windows WHERE user_id = ?", (user_id,)).fetchone()
+
+    def stats(self):
+        now = time.time()
+        return {
+            "open_windows": sum(1 for _, opened_at in self.windows.values() if opened_at > now - self.window_seconds),
+            "created": self.created,
+            "coalesced": self.coalesced,
+        }
+
+sos_coalescer = SOSCoalescer(
+    window_seconds=float(os.getenv("SOS_COALESCE_WINDOW_SECONDS", "300")),
+    path=os.getenv("SOS_COALESCE_PATH") or None,
+)
@@ -0,0 +1,334 @@
+import asyncio, json, random, sqlite3, threading, time
+from src.utils.logger import logging
+
+CHANNELS = ("whatsapp", "call")
+
+class SOSOutbox:
+    '''
+    Durable SQLite outbox for SOS notifications, drained by a pool of worker tasks.
+
+    enqueue() records the alert in the `alerts` table and returns. A worker later claims the alert, resolves
+    the user's contacts and expands it into one row per (alert_id, channel, phone_number) in `deliveries`.
+    That key is the idempotency key: expanding the same alert again never duplicates a delivery, and sent
+    deliveries are never sent again. If the contact lookup fails (None or an exception), the alert stays
+    pending and is retried; only an empty contact list expands to no deliveries.
+
+    The worker then claims every due delivery of the alert at once and sends them together, so the
+    dispatcher's per-channel concurrency limits (not the number of workers) bound the fan-out.
+
+    Rows are claimed with a lease. If a worker or the whole process dies mid-delivery, the lease expires
+    and another worker picks the row up again, so delivery is at-least-once. Failed deliveries are retried
+    with backoff until `max_attempts`, then marked failed.
+    '''
+    def __init__(self, path, resolve_contacts, dispatcher, workers=4, lease_seconds=60, max_attempts=5, poll_interval=1.0, backoff_base=2.0):
+        self.path = path
+        self.resolve_contacts = resolve_contacts
+        self.dispatcher = dispatcher
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.backoff_base = backoff_base
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS alerts (
+            alert_id INTEGER PRIMARY KEY, user_details TEXT, status TEXT, attempts INTEGER,
+            lease_until REAL, next_attempt_at REAL, last_error TEXT, created_at REAL)""")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS deliveries (
+            key TEXT PRIMARY KEY, alert_id INTEGER, channel TEXT, contact TEXT, status TEXT, attempts INTEGER,
+            lease_until REAL, next_attempt_at REAL, last_error TEXT, created_at REAL, sent_at REAL)""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS deliveries_due ON deliveries (status, next_attempt_at)")
+        self._wakeup = None
+        self._tasks = []
+
+    def enqueue(self, alert_id, user_details):
+        '''
+        Durably record an SOS alert for delivery. Enqueuing the same alert twice is a no-op.
+        '''
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR IGNORE INTO alerts VALUES (?, ?, 'pending', 0, 0, ?, NULL, ?)",
+                (alert_id, json.dumps(user_details), now, now)
+            )
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _claim(self, table, key_column):
+        # Take the oldest due row whose lease is free and lease it to the caller
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    f"SELECT * FROM {table} WHERE status = 'pending' AND next_attempt_at <= ? AND lease_until <= ? "
+                    f"ORDER BY next_attempt_at LIMIT 1", (now, now)
+                ).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        f"UPDATE {table} SET lease_until = ?, attempts = attempts + 1 WHERE {key_column} = ?",
+                        (now + self.lease_seconds, row[0])
+                    )
+                    # Re-read so the caller sees the attempt it is making in `attempts`
+                    row = self._db.execute(f"SELECT * FROM {table} WHERE {key_column} = ?", (row[0],)).fetchone()
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return row
+
+    def _claim_deliveries(self, alert_id=None):
+        # Lease every due delivery of one alert: the given one, else the alert with the oldest due delivery
+        now = time.time()
+        due = "status = 'pending' AND next_attempt_at <= ? AND lease_until <= ?"
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                if alert_id is None:
+                    row = self._db.execute(
+                        f"SELECT alert_id FROM deliveries WHERE {due} ORDER BY next_attempt_at LIMIT 1", (now, now)
+                    ).fetchone()
+                    alert_id = row[0] if row is not None else None
+                rows = []
+                if alert_id is not None:
+                    keys = [row[0] for row in self._db.execute(f"SELECT key FROM deliveries WHERE alert_id = ? AND {due}", (alert_id, now, now))]
+                    self._db.executemany(
+                        "UPDATE deliveries SET lease_until = ?, attempts = attempts + 1 WHERE key = ?",
+                        [(now + self.lease_seconds, key) for key in keys]
+                    )
+                    # Re-read so the caller sees the attempt it is making in `attempts`
+                    rows = [self._db.execute("SELECT * FROM deliveries WHERE key = ?", (key,)).fetchone() for key in keys]
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return rows
+
+    def _retry_or_fail(self, table, key_column, key, attempts, error):
+        status = "failed" if attempts >= self.max_attempts else "pending"
+        delay = random.uniform(0.5, 1.0) * self.backoff_base * (2 ** (attempts - 1))
+        with self._lock:
+            self._db.execute(
+                f"UPDATE {table} SET status = ?, lease_until = 0, next_attempt_at = ?, last_error = ? WHERE {key_column} = ?",
+                (status, time.time() + delay, error, key)
+            )
+        if status == "failed":
+            logging.error(f"Giving up on {table} {key} after {attempts} attempts: {error}")
+
+    async def _expand(self, row):
+        alert_id, user_details, _, attempts = row[:4]
+        user_details = json.loads(user_details)
+        try:
+            contacts = await self.resolve_contacts(user_details["user_id"])
+        except Exception as e:
+            self._retry_or_fail("alerts", "alert_id", alert_id, attempts, str(e))
+            return False
+        if contacts is None:
+            # The lookup failed, which is not the same as a user without contacts: keep the alert pending
+            self._retry_or_fail("alerts", "alert_id", alert_id, attempts, "Contact lookup failed")
+            return False
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                for contact in contacts:
+                    for channel in CHANNELS:
+                        self._db.execute(
+                            "INSERT OR IGNORE INTO deliveries VALUES (?, ?, ?, ?, 'pending', 0, 0, ?, NULL, ?, NULL)",
+                            (f"{alert_id}:{channel}:{contact['phone_number']}", alert_id, channel,
+                             json.dumps({"user_details": user_details, "contact": contact}), now, now)
+                        )
+                self._db.execute("UPDATE alerts SET status = 'expanded', lease_until = 0 WHERE alert_id = ?", (alert_id,))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        if not contacts:
+            logging.warning(f"SOS alert {alert_id}: no contacts added.")
+        # Other workers may pick up deliveries of this alert too (e.g. after a crash)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return True
+
+    async def _send(self, row):
+        key, alert_id, channel, payload, _, attempts = row[:6]
+        payload = json.loads(payload)
+        try:
+            result = await self.dispatcher.deliver(channel, payload["user_details"], payload["contact"])
+        except Exception as e:
+            result = {"ok": False, "error": str(e)}
+        if result["ok"]:
+            with self._lock:
+                self._db.execute(
+                    "UPDATE deliveries SET status = 'sent', lease_until = 0, last_error = NULL, sent_at = ? WHERE key = ?",
+                    (time.time(), key)
+                )
+        else:
+            self._retry_or_fail("deliveries", "key", key, attempts, result["error"])
+
+    async def _send_all(self, rows):
+        await asyncio.gather(*[self._send(row) for row in rows])
+
+    async def _worker(self):
+        while True:
+            try:
+                row = self._claim("alerts", "alert_id")
+                if row is not None:
+                    # Send the new alert's deliveries straight away rather than on the next poll
+                    if await self._expand(row):
+                        await self._send_all(self._claim_deliveries(row[0]))
+                    continue
+                rows = self._claim_deliveries()
+                if rows:
+                    await self._send_all(rows)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"SOS outbox worker error: {e}")
+            # Nothing due: sleep until the next enqueue or poll tick
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self):
+        with self._lock:
+            alerts = dict(self._db.execute("SELECT status, COUNT(*) FROM alerts GROUP BY status").fetchall())
+            deliveries = dict(self._db.execute("SELECT status, COUNT(*) FROM deliveries GROUP BY status").fetchall())
+        return {"workers": len(self._tasks), "alerts": alerts, "deliveries": deliveries}
+
+if __name__=="__main__":
+    import os, tempfile
+    from src.services.notification_dispatcher import NotificationDispatcher
+
+    contacts = [{"name": f"Contact {i}", "relation": "Family", "phone_number": f"+9100000000{i}"} for i in range(3)]
+    user = {"user_id": "user", "username": "User", "latitude": 12.97, "longitude": 77.59}
+    sent = []
+
+    class _Dispatcher:
+        async def deliver(self, channel, user_details, contact):
+            sent.append((channel, contact["phone_number"]))
+            return {"ok": True, "error": None}
+
+    async def resolve(user_id):
+        return contacts
+
+    async def wait_until_drained(outbox):
+        while outbox.stats()["deliveries"].get("pending") or outbox.stats()["alerts"].get("pending"):
+            await asyncio.sleep(0.01)
+
+    async def crash_recovery():
+        # A delivery leased by a dead worker is picked up again once its lease expires
+        outbox = SOSOutbox(os.path.join(tempfile.mkdtemp(), "outbox.sqlite3"), resolve, _Dispatcher(), lease_seconds=0.2, poll_interval=0.05)
+        start = time.perf_counter()
+        for alert_id in range(1000):
+            outbox.enqueue(alert_id, user)
+        print(f"enqueue: {(time.perf_counter() - start) / 1000 * 1e6:.0f} us per alert")
+        outbox.enqueue(0, user)
+
+        # Simulate a crash: expand alert 0 and lease one delivery without ever sending it
+        await outbox._expand(outbox._claim("alerts", "alert_id"))
+        outbox._claim("deliveries", "key")
+
+        await outbox.start()
+        await wait_until_drained(outbox)
+        await outbox.stop()
+        print(outbox.stats())
+        assert len(sent) == 1000 * len(contacts) * len(CHANNELS)
+
+    async def failed_lookup():
+        # A failed contact lookup (None, then an exception) keeps the alert pending until a lookup succeeds
+        lookups = []
+
+        async def flaky(user_id):
+            lookups.append(user_id)
+            if len(lookups) == 1:
+                return None
+            if len(lookups) == 2:
+                raise ConnectionError("Supabase unavailable")
+            return contacts
+
+        sent.clear()
+        outbox = SOSOutbox(os.path.join(tempfile.mkdtemp(), "outbox.sqlite3"), flaky, _Dispatcher(), poll_interval=0.01, backoff_base=0.01)
+        outbox.enqueue(1, user)
+        assert not await outbox._expand(outbox._claim("alerts", "alert_id"))
+        assert outbox.stats() == {"workers": 0, "alerts": {"pending": 1}, "deliveries": {}}, outbox.stats()
+        await outbox.start()
+        await wait_until_drained(outbox)
+        await outbox.stop()
+        assert len(lookups) == 3 and len(sent) == len(contacts) * len(CHANNELS), (lookups, sent)
+        print(f"failed lookup: retried, delivered after {len(lookups)} lookups, {outbox.stats()}")
+
+    async def fan_out():
+        # Time until every notification of one alert is sent, through the outbox and through dispatch() directly
+        SEND_S, CALL_S = 0.4, 0.8
+        five = [{"name": f"Contact {i}", "relation": "Family", "phone_number": f"+9100000000{i}"} for i in range(5)]
+
+        class _WhatsApp:
+            async def send_whatsapp_message(self, phone_number, data):
+                await asyncio.sleep(SEND_S)
+                return True
+
+        class _Twilio:
+            def call_contact(self, user_name, number):
+                time.sleep(CALL_S)
+                return "CA" + number
+
+        async def resolve_five(user_id):
+            return five
+
+        dispatcher = NotificationDispatcher(_WhatsApp(), _Twilio())
+        start = time.perf_counter()
+        await dispatcher.dispatch(user, five)
+        direct = (time.perf_counter() - start) * 1000
+
+        outbox = SOSOutbox(os.path.join(tempfile.mkdtemp(), "outbox.sqlite3"), resolve_five, dispatcher)
+        await outbox.start()
+        start = time.perf_counter()
+        outbox.enqueue(1, user)
+        await asyncio.sleep(0)
+        await wait_until_drained(outbox)
+        queued = (time.perf_counter() - start) * 1000
+        await outbox.stop()
+        assert outbox.stats()["deliveries"] == {"sent": 10}, outbox.stats()
+        print(f"5 contacts: dispatch() {direct:.0f} ms, through the outbox {queued:.0f} ms")
+
+    async def gives_up():
+        # A delivery that always fails is attempted exactly max_attempts times, with backoff starting at backoff_base
+        attempts = []
+
+        class _Failing:
+            async def deliver(self, channel, user_details, contact):
+                attempts.append(time.perf_counter())
+                return {"ok": False, "error": "unreachable"}
+
+        outbox = SOSOutbox(os.path.join(tempfile.mkdtemp(), "outbox.sqlite3"), lambda user_id: asyncio.sleep(0, contacts[:1]), _Failing(), max_attempts=3, poll_interval=0.01, backoff_base=0.1)
+        outbox.enqueue(1, user)
+        await outbox.start()
+        await wait_until_drained(outbox)
+        await outbox.stop()
+        assert outbox.stats()["deliveries"] == {"failed": len(CHANNELS)}, outbox.stats()
+        assert len(attempts) == 3 * len(CHANNELS), attempts
+        first_delay = attempts[len(CHANNELS)] - attempts[0]
+        assert 0.05 <= first_delay < 0.2, first_delay
+        print(f"gives up: {len(attempts) // len(CHANNELS)} attempts per delivery, first retry after {first_delay * 1000:.0f} ms")
+
+    asyncio.run(crash_recovery())
+    asyncio.run(failed_lookup())
+    asyncio.run(gives_up())
+    asyncio.run(fan_out())
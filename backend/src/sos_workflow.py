@@ -1,55 +1,57 @@
-from src.database.supabase_config import Supabase
+from src.database.async_supabase import AsyncSupabase
 from src.utils.exception import customException
 from src.utils.logger import logging
-from src.services.whatsapp_config import WhatsApp
-import requests, json
-from src.services.pinata_config import Pinata
-from src.services.twilio_config import Twilio
-
-supabase=Supabase()
-meta=WhatsApp()
-pinata=Pinata()
-twilio=Twilio()
-
-def get_contacts(user_id):
-    # Retrieve all hashes stored in Supabase
-    res = supabase.get_emergency_contact_hash(user_id)
-
-    # Iterate through each hash and retrieve data from IPFS
-    for record in res.data:
-        ipfs_hash = record["emergency_contacts"]
-        retrieved_response = pinata.get_data_from_ipfs(ipfs_hash)
-
-        # Check if data retrieval was successful
-        if retrieved_response.status_code == 200:
-            data_dict = retrieved_response.json()
-            return data_dict["family_members"]
-        else:
-            return None
+import json, asyncio, os
+from src.clients import supabase, whatsapp, pinata, twilio
+from src.contact_store import contact_store, resolve_contacts
+from src.services.notification_dispatcher import NotificationDispatcher
+from src.sos_outbox import SOSOutbox
+
+db=AsyncSupabase(supabase)
+dispatcher=NotificationDispatcher(
+    whatsapp, twilio,
+    whatsapp_concurrency=int(os.getenv("NOTIFY_WHATSAPP_CONCURRENCY", "10")),
+    call_concurrency=int(os.getenv("NOTIFY_CALL_CONCURRENCY", "5")),
+    timeout=float(os.getenv("NOTIFY_TIMEOUT_SECONDS", "10")),
+    retries=int(os.getenv("NOTIFY_RETRIES", "2")),
+)
+
+async def get_contacts(user_id):
+    # Contacts are normally pre-resolved in the hot store; fall back to Supabase and IPFS on a miss
+    contacts = contact_store.get(user_id)
+    if contacts is not None:
+        return contacts
+
+    logging.warning(f"Emergency contacts of {user_id} not in the contact store or expired, resolving remotely.")
+    contacts = await resolve_contacts(db, pinata, user_id)
+    if contacts is not None:
+        contact_store.set(user_id, contacts)
+        return contacts
+    # The lookup failed: expired contacts are better than none for an SOS (None makes the outbox retry)
+    return contact_store.get(user_id, allow_stale=True)
+
+async def warm_contacts(user_id):
+    await contact_store.warm(db, pinata, user_id)
 
 async def notify_contacts(user_details):
-    # Retrieve contacts from Supabase
-    contacts=get_contacts(user_details["user_id"])
-    family_contacts=[]
+    # Retrieve contacts from the contact store
+    contacts=await get_contacts(user_details["user_id"])
     
     if not contacts:
         print("No contacts added.")
-        return
-
-    for contact in contacts:
-        data={
-            "recipient":contact["name"],
-            "user":user_details["username"],
-            "latitude":user_details["latitude"],
-            "longitude":user_details["longitude"]
-        }
-        
-        meta.send_whatsapp_message(contact["phone_number"],data)
-        family_contacts.append(contact["phone_number"])
-        print(f'Notified {contact["name"]} at {contact["phone_number"]}')
-        logging.info(f'Notified {contact["name"]} at {contact["phone_number"]}')
-    
-    twilio.make_emergency_call(user_details["username"],family_contacts)
+        return []
+
+    # WhatsApp messages and calls to every contact go out at once
+    return await dispatcher.dispatch(user_details, contacts)
+
+# Durable queue of SOS alerts, drained by worker tasks started with the app
+sos_outbox=SOSOutbox(
+    os.getenv("SOS_OUTBOX_PATH", "sos_outbox.sqlite3"),
+    get_contacts, dispatcher,
+    workers=int(os.getenv("SOS_OUTBOX_WORKERS", "4")),
+    lease_seconds=float(os.getenv("SOS_OUTBOX_LEASE_SECONDS", "60")),
+    max_attempts=int(os.getenv("SOS_OUTBOX_MAX_ATTEMPTS", "5")),
+)
 
 if __name__=="__main__":
     user={
@@ -58,4 +60,4 @@ if __name__=="__main__":
         "latitude":12.3456,
         "longitude":78.9012
     }
-    notify_contacts(user)
\ No newline at end of file
+    asyncio.run(notify_contacts(user))
\ No newline at end of file
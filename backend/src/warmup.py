@@ -0,0 +1,74 @@
+import asyncio, time
+from src.utils.logger import logging
+
+class WarmUp:
+    '''
+    Explicit warm-up phase run after startup, backing the /ready endpoint.
+
+    Steps (model preload, dummy inference, client construction, connection priming) run concurrently in
+    the background, so the process accepts connections immediately. It reports ready once every required
+    step that is not skipped has succeeded. Optional steps are timed and reported but never block readiness.
+    '''
+    def __init__(self):
+        self.steps = []
+        self.results = {}
+        self.ready = False
+        self.finished = False
+        self.elapsed_ms = None
+
+    def add(self, name, func, required=True):
+        '''
+        Register a step: `func` is a coroutine function taking no arguments.
+        '''
+        self.steps.append((name, func, required))
+
+    async def _run_step(self, name, func, required):
+        start = time.perf_counter()
+        try:
+            await func()
+            self.results[name] = {"ok": True, "required": required, "ms": (time.perf_counter() - start) * 1000}
+        except Exception as e:
+            logging.error(f"Warm-up step {name} failed: {e}")
+            self.results[name] = {"ok": False, "required": required, "ms": (time.perf_counter() - start) * 1000, "error": str(e)}
+
+    async def run(self, skip=()):
+        start = time.perf_counter()
+        for name in skip:
+            self.results[name] = {"ok": None, "skipped": True}
+        await asyncio.gather(*[self._run_step(name, func, required) for name, func, required in self.steps if name not in skip])
+        self.elapsed_ms = (time.perf_counter() - start) * 1000
+        self.finished = True
+        self.ready = all(result["ok"] for result in self.results.values() if result.get("required"))
+        logging.info(f"Warm-up finished in {self.elapsed_ms:.0f} ms, ready: {self.ready}, steps: {self.results}")
+        return self.ready
+
+    def status(self):
+        return {"ready": self.ready, "finished": self.finished, "elapsed_ms": self.elapsed_ms, "steps": self.results}
+
+warmup = WarmUp()
+
+if __name__=="__main__":
+    import subprocess, sys
+
+    def import_seconds(statement):
+        # Fresh interpreter per measurement, so nothing is already imported
+        code = f"import time; start = time.perf_counter(); {statement}; print(time.perf_counter() - start)"
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+        if result.returncode != 0:
+            return f"failed: {result.stderr.strip().splitlines()[-1] if result.stderr.strip() else result.returncode}"
+        return f"{float(result.stdout.strip().splitlines()[-1]) * 1000:.0f} ms"
+
+    # What importing the app costs now, and what the deferred dependencies would have added
+    for statement in ("import application", "import tensorflow", "import librosa", "import supabase", "import firebase_admin", "import twilio.rest"):
+        print(f"{statement:<24} {import_seconds(statement)}")
+
+    async def main():
+        import application
+        start = time.perf_counter()
+        await application.startup()
+        print(f"startup(): {(time.perf_counter() - start) * 1000:.0f} ms")
+        await application.warmup_task
+        print(warmup.status())
+        await application.shutdown()
+
+    asyncio.run(main())